@@ -1,10 +1,23 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 import io 
 from io import BytesIO
 import logging 
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from report_engine import (EXPORT_FORMATS, SchemaError, build_daily_cube, calculate_profit_loss, combined_by_sector,
+                           content_digest, export_report, inventory_by_sector, join_inventory_profit_loss, margin_by_load_factor,
+                           profit_loss_by_sector, ratios_by_sector, read_base_price_index, read_inventory_report,
+                           read_sales_report, save_modified_sales, sector_totals, slice_by_date)
+from report_charts import (bottom_sectors_bar, build_gauge_grid, margin_by_load_band_bar, margin_load_factor_scatter,
+                           profit_trend_line, sector_profit_bar, select_gauge_sectors, top_sectors_pie,
+                           unsold_exposure_bar)
+from stage_metrics import measure, row_count, run_records, start_run
 
 logging.getLogger().setLevel(logging.ERROR)
 
@@ -40,7 +53,7 @@ def show_upload_page():
     st.markdown("<div class='upload-text'>Upload your Base Price File</div>", unsafe_allow_html=True)
     base_price_uploaded_file = st.file_uploader("Choose a Base Price file", type=["xlsx"], key="base_price", label_visibility="collapsed")
     
-    col1,spacer1, col2, spacer2, col3 = st.columns([1,1,1,1,1], gap="small")
+    col1,spacer1, col2, spacer2, col3, spacer3, col4 = st.columns([1,1,1,1,1,1,1], gap="small")
     
     with col1: 
         if st.button("Inventory Report", key="next"):
@@ -74,87 +87,378 @@ def show_upload_page():
             else:
                 st.error("Please upload all required files before proceeding.")
 
+    with col4:
+        if st.button("Seats & Revenue"):
+            if uploaded_file and sales_uploaded_file and base_price_uploaded_file:
+                st.session_state.page = 'combined_analytics'
+                st.session_state.uploaded_file = uploaded_file
+                st.session_state.sales_uploaded_file = sales_uploaded_file
+                st.session_state.base_price_uploaded_file = base_price_uploaded_file
+            else:
+                st.error("Please upload all required files before proceeding.")
+
+# ---------------------------------------------------------------------------
+# Shared preprocessing pipeline
+#
+# Every page goes through the stages below instead of defining its own cached
+# helpers, so switching between pages or rerunning after a widget interaction
+# reuses the work already done. Stage results are keyed by a content hash of
+# the uploaded bytes and held in one process-wide LRU cache with a memory cap.
+# ---------------------------------------------------------------------------
+
+# Upper bound on the memory held by the pipeline cache, in megabytes
+PIPELINE_CACHE_MAX_MB = int(os.environ.get('AA_PIPELINE_CACHE_MB', '512'))
+
+# Rough in-memory size of a cached stage result, used for the memory cap
+def estimate_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, BytesIO):
+        return value.getbuffer().nbytes
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+# LRU cache of stage results, evicting the least recently used entries once the
+# total estimated size goes over max_bytes. Results are shared, not copied, so
+# stages must never modify the frames they receive.
+class PipelineCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Returns (True, value) for a cached key and (False, None) otherwise
+    def lookup(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return True, self._entries[key][0]
+        return False, None
+
+    def get_or_compute(self, key, compute):
+        found, value = self.lookup(key)
+        if found:
+            return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            # Keep the newest entry even if it alone exceeds the cap
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+# One cache per server process, shared by all sessions and pages
+@st.cache_resource
+def get_pipeline_cache():
+    return PipelineCache(PIPELINE_CACHE_MAX_MB * 1024 * 1024)
+
+# Content hash of an uploaded file; memoized per upload so reruns don't rehash the bytes
+def file_digest(uploaded_file):
+    digests = st.session_state.setdefault('file_digests', {})
+    upload_key = getattr(uploaded_file, 'file_id', None) or id(uploaded_file)
+    if upload_key not in digests:
+        digests[upload_key] = content_digest(uploaded_file.getvalue())
+    return digests[upload_key]
+
+# Every stage is timed; the cache outcome and rows produced go into its metrics record
+def run_stage(stage, key, compute, rows_in=None):
+    with measure(stage, rows_in=rows_in) as record:
+        record['cache'] = 'hit'
+
+        def compute_on_miss():
+            record['cache'] = 'miss'
+            return compute()
+
+        value = get_pipeline_cache().get_or_compute((stage,) + tuple(key), compute_on_miss)
+        record['rows_out'] = row_count(value)
+    return value
+
+# ---------------------------------------------------------------------------
+# Background jobs
+#
+# The heavy stages run on a process-wide thread pool instead of the script
+# thread. A cached result comes back at once; otherwise the stage is submitted
+# as a job (or joined, if another run or session already started it) and the
+# page shows its progress and polls until it is done, so widget clicks never
+# start the work again or wait on it. When a session asks for a stage with a
+# new key, e.g. after uploading another file, its old job of that stage is
+# cancelled unless another session still wants it: a job that has not started
+# is dropped and a running one stops before its next sheet.
+#
+# A finished job's result is handed to the session waiting on it and kept on
+# its job entry until the page has rendered with no job of the session still
+# running, so a page whose stages don't all fit in the pipeline cache at once
+# still completes. Jobs leave the process-wide registry as soon as they finish.
+#
+# Jobs never touch Streamlit: their inputs, uploaded bytes included, are
+# resolved in the script thread and only the finished result goes into the
+# pipeline cache. A stage only loads its upstream stages when its own result
+# is not already at hand, so a cached result never re-reads the uploads.
+# ---------------------------------------------------------------------------
+
+# Threads running background stages; 0 runs every stage in the script thread
+BACKGROUND_WORKERS = int(os.environ.get('AA_BACKGROUND_WORKERS', '2'))
+POLL_SECONDS = 0.5
+
+class JobCancelled(Exception):
+    pass
+
+class BackgroundJob:
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self.owners = set()
+        self.step, self.done, self.total = 'Waiting', 0, None
+        self.future = None
+
+    # Progress callback handed to the engine; raising here is how a running job is cancelled
+    def report(self, step, done, total):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        self.step, self.done, self.total = step, done, total
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.future.cancel()
+
+class BackgroundJobs:
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pipeline')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, run, owner):
+        with self._lock:
+            job = self._jobs.get(key)
+            started = job is None or job.cancel_event.is_set()
+            if started:
+                job = BackgroundJob()
+                job.future = self.executor.submit(run, job)
+                self._jobs[key] = job
+            job.owners.add(owner)
+        # Outside the lock: the callback runs right away if the job already finished
+        if started:
+            job.future.add_done_callback(lambda future: self._forget(key, job))
+        return job
+
+    def _forget(self, key, job):
+        with self._lock:
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+
+    def release(self, key, job, owner):
+        with self._lock:
+            job.owners.discard(owner)
+            abandoned = not job.owners and not job.future.done()
+            if abandoned and self._jobs.get(key) is job:
+                del self._jobs[key]
+        # Outside the lock: cancelling a queued job runs its done callback right away
+        if abandoned:
+            job.cancel()
+
+@st.cache_resource
+def get_background_jobs():
+    return BackgroundJobs(max(BACKGROUND_WORKERS, 1))
+
+def _run_job(job, stage, cache_key, compute, cache, context, rows_in):
+    start_run(background=True, **context)
+    with measure(stage, cache='miss', rows_in=rows_in) as record:
+        value = compute(job.report)
+        record['rows_out'] = row_count(value)
+    cache.put(cache_key, value)
+    return value
+
+# Result of a stage from this run, the session's job or the cache; otherwise start or join its
+# background job, show its progress and rerun until it is done. prepare() runs in the script
+# thread only when the stage has to be computed: it resolves the stage's inputs (loading the
+# upstream stages it needs) and returns compute(progress), which must only use those values,
+# together with the inputs counted for the rows-in metric.
+def run_stage_in_background(stage, key, prepare, label):
+    cache_key = (stage,) + tuple(key)
+    # Every stage is looked up once per run, however many loaders ask for it
+    run_results = st.session_state.setdefault('run_results', {})
+    if cache_key in run_results:
+        return run_results[cache_key]
+
+    owner = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+    session_jobs = st.session_state.setdefault('background_jobs', {})
+    previous = session_jobs.get(stage)
+    if previous is not None and previous[0] != cache_key:
+        get_background_jobs().release(*previous, owner)
+        del session_jobs[stage]
+        previous = None
+
+    if previous is not None:
+        job = previous[1]
+    else:
+        found, value = get_pipeline_cache().lookup(cache_key)
+        if found:
+            with measure(stage, cache='hit') as record:
+                record['rows_out'] = row_count(value)
+            run_results[cache_key] = value
+            return value
+        compute, inputs = prepare()
+        rows_in = sum(row_count(value) or 0 for value in inputs) if inputs else None
+        if BACKGROUND_WORKERS <= 0:
+            run_results[cache_key] = run_stage(stage, key, lambda: compute(None), rows_in=rows_in)
+            return run_results[cache_key]
+        cache = get_pipeline_cache()
+        context = {'page': st.session_state.page}
+        job = get_background_jobs().submit(
+            cache_key, lambda job: _run_job(job, stage, cache_key, compute, cache, context, rows_in), owner)
+        session_jobs[stage] = (cache_key, job)
+
+    if job.future.done():
+        if job.future.exception() is not None:
+            del session_jobs[stage]
+        run_results[cache_key] = job.future.result()
+        return run_results[cache_key]
+    fraction = min(job.done / job.total, 1.0) if job.total else 0.0
+    count = f"{job.done}/{job.total}" if job.total else f"{job.done:,}"
+    st.progress(fraction, text=f"{label}: {job.step} {count}")
+    st.session_state['waiting_on_jobs'] = True
+    time.sleep(POLL_SECONDS)
+    st.rerun()
+
+# After a run that did not stop to wait on a job, and once none of the session's jobs is
+# running, the page has what it needs: drop the finished results the session held
+def release_finished_jobs():
+    if st.session_state.pop('waiting_on_jobs', False):
+        return
+    session_jobs = st.session_state.get('background_jobs', {})
+    if all(job.future.done() for _, job in session_jobs.values()):
+        session_jobs.clear()
+
+# The workbook bytes are read here, in the script thread, and only when the stage has to run
+def load_sales_report(uploaded_file):
+    digest = file_digest(uploaded_file)
+
+    def prepare():
+        data = uploaded_file.getvalue()
+        return (lambda progress: read_sales_report(data, digest, progress=progress)), ()
+    return run_stage_in_background('sales_report', (digest,), prepare, "Loading Sales report")
+
+def load_base_price_index(uploaded_file):
+    digest = file_digest(uploaded_file)
+
+    def prepare():
+        data = uploaded_file.getvalue()
+        return (lambda progress: read_base_price_index(data, digest, progress=progress)), ()
+    return run_stage_in_background('base_price_index', (digest,), prepare, "Loading Base Price file")
+
+# Profit/loss of every booking, computed once per (sales, base price) pair. The inputs are
+# only loaded when the result is in neither this run nor the cache.
+def load_profit_loss(sales_file, base_price_file):
+    key = (file_digest(sales_file), file_digest(base_price_file))
+
+    def prepare():
+        sales, base_index = load_sales_report(sales_file), load_base_price_index(base_price_file)
+        return (lambda progress: calculate_profit_loss(sales, base_index, progress=progress)), (sales,)
+    return run_stage_in_background('profit_loss', key, prepare, "Calculating Profit/Loss")
+
+def load_daily_cube(sales_file, base_price_file):
+    key = (file_digest(sales_file), file_digest(base_price_file))
+
+    def prepare():
+        temporary_df = load_profit_loss(sales_file, base_price_file)
+        return (lambda progress: build_daily_cube(temporary_df)), (temporary_df,)
+    return run_stage_in_background('daily_cube', key, prepare, "Building daily totals")
+
+# Changing the sidebar dates only re-slices the stored result, nothing is recomputed
+def slice_for_range(df, start_date, end_date):
+    with measure('slice_by_date', rows_in=len(df)) as record:
+        sliced = slice_by_date(df, start_date, end_date)
+        record['rows_out'] = len(sliced)
+    return sliced
+
+def load_inventory_report(uploaded_file):
+    digest = file_digest(uploaded_file)
+
+    def prepare():
+        data = uploaded_file.getvalue()
+        return (lambda progress: read_inventory_report(data, digest, progress=progress)), ()
+    return run_stage_in_background('inventory_report', (digest,), prepare, "Loading Inventory report")
+
+# Inventory flight-days joined to their bookings, computed once per set of uploads
+def load_inventory_profit_loss(inventory_file, sales_file, base_price_file):
+    key = (file_digest(inventory_file), file_digest(sales_file), file_digest(base_price_file))
+
+    def prepare():
+        df2, temporary_df = load_inventory_report(inventory_file), load_profit_loss(sales_file, base_price_file)
+        return (lambda progress: join_inventory_profit_loss(df2, temporary_df)), (df2, temporary_df)
+    return run_stage_in_background('inventory_profit_loss', key, prepare, "Joining inventory and bookings")
+
+# Format picker and download button under a report table. The file is only written when
+# asked for, to a temporary file that is gone once the download button has taken its bytes;
+# it is not kept in the pipeline cache, where it would push out the tables it came from.
+def export_buttons(df, name):
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        export_format = st.selectbox("Export format", list(EXPORT_FORMATS), key=f'{name}_export_format',
+                                     label_visibility="collapsed")
+    with col2:
+        if st.button(f"Prepare {export_format} export", key=f'{name}_export'):
+            extension, mime = EXPORT_FORMATS[export_format]
+            with measure('export', rows_in=len(df)):
+                export_file = export_report(df, export_format, sheet_name=name)
+            with export_file:
+                st.download_button(f"Download {name}.{extension}", data=export_file, file_name=f"{name}.{extension}",
+                                   mime=mime, key=f'{name}_download')
+
 # Function to show the results page
 def inventory_report_page():
-    # Read the uploaded files
-    df1 = pd.read_excel(st.session_state.sales_uploaded_file, sheet_name=None)
-    df2 = pd.read_excel(st.session_state.uploaded_file)
-    df3 = pd.read_excel(st.session_state.base_price_uploaded_file, sheet_name=None)
-
-    # Process the inventory report
-    df2.drop(columns=['DayWise Id', 'Coupon Id', 'Dep Time', 'Arr Date', 'Arr Time', 
-                      'Starting Price', 'Total Fare', 'PNR', 'Series Owner'], axis=1, inplace=True)
-    df2['Flight Number'] = df2['Flight Number'].str.replace('QP-', '', regex=False)
-    df2['Sector'] = df2['Sector'].str.replace('-', '', regex=False)
-    df2.rename(columns={'Current Seat': 'Unsold Seats', 'Total Seat': 'Total Seats'}, inplace=True)
-
-    #removing the rows where total seats is 0 to avoid division by zero error
-    df2 = df2[df2['Total Seats'] != 0]
-    
-    # Adding new columns
-    df2['Sold Seats'] = df2['Total Seats'] - df2['Unsold Seats']
-    df2['MAT_Ratio'] = df2['Sold Seats'] / df2['Total Seats'] * 100
-    df2['Release Ratio'] = df2['Unsold Seats'] / df2['Total Seats'] * 100
+    try:
+        df2 = load_inventory_report(st.session_state.uploaded_file)
+    except SchemaError as e:
+        st.error(str(e))
+        st.stop()
 
     # Display the processed DataFrame
     st.markdown("<h2 style='text-align: center;'>Processed Inventory Report</h2>", unsafe_allow_html=True)
     st.dataframe(df2)
+    export_buttons(df2, 'inventory_report')
 
     st.markdown("<h2 style='text-align: center;'>Inventory Report by Sector</h2>", unsafe_allow_html=True)
-    new_df = df2.groupby('Sector').agg({
-        'Total Seats': 'sum', 
-        'Sold Seats': 'sum', 
-        'Unsold Seats': 'sum', 
-        'MAT_Ratio': 'mean', 
-        'Release Ratio': 'mean'
-    }).reset_index()
+    new_df = inventory_by_sector(df2)
     st.dataframe(new_df, use_container_width=True)
+    export_buttons(new_df, 'inventory_by_sector')
 
     # Defining the grouped_df
     st.markdown("<h2 style='text-align: center;'>Inventory Analytics</h2>", unsafe_allow_html=True)
-    grouped_df = df2.groupby('Sector').agg({'MAT_Ratio': 'mean', 'Release Ratio': 'mean'}).reset_index()
-
-    # Create gauge charts for MAT Ratio and Release Ratio
-    for sector in grouped_df['Sector']:
-        mat_ratio = grouped_df.loc[grouped_df['Sector'] == sector, 'MAT_Ratio'].values[0]
-        release_ratio = grouped_df.loc[grouped_df['Sector'] == sector, 'Release Ratio'].values[0]
-
-        # Create the gauge chart for MAT Ratio
-        fig_mat = go.Figure(go.Indicator(
-            mode="gauge+number",
-            value=mat_ratio,
-            title={'text': f"MAT Ratio for {sector}", 'font': {'color': "silver"}},
-            gauge={
-                'axis': {'range': [0, 100]},
-                'bar': {'color': "black"},
-                'steps': [
-                    {'range': [0, 50], 'color': "crimson"},
-                    {'range': [50, 100], 'color': "lightgreen"},
-                ],
-            }
-        ))
-
-        # Create the gauge chart for Release Ratio
-        fig_release = go.Figure(go.Indicator(
-            mode="gauge+number",
-            value=release_ratio,
-            title={'text': f"Release Ratio for {sector}", 'font': {'color': "silver"}},
-            gauge={
-                'axis': {'range': [0, 100]},
-                'bar': {'color': "black"},
-                'steps': [
-                    {'range': [0, 50], 'color': "crimson"},
-                    {'range': [50, 100], 'color': "lightgreen"},
-                ],
-            }
-        ))
+    grouped_df = ratios_by_sector(df2)
+
+    # Limit how many gauges are rendered at once
+    col1, col2 = st.columns(2)
+    with col1:
+        gauge_order = st.selectbox("Sectors to show", ["Worst by MAT Ratio", "Top by MAT Ratio", "All sectors"],
+                                   key='gauge_order')
+    with col2:
+        gauge_count = st.number_input("Number of sectors", min_value=1, max_value=max(len(grouped_df), 1),
+                                      value=min(10, max(len(grouped_df), 1)), key='gauge_count',
+                                      disabled=gauge_order == "All sectors")
+    gauge_df = select_gauge_sectors(grouped_df, gauge_order, int(gauge_count))
 
-        # Display the gauge charts
-        col1, col2 = st.columns(2)
-        with col1:
-            st.plotly_chart(fig_mat, use_container_width=True)
-        with col2:
-            st.plotly_chart(fig_release, use_container_width=True)
+    # Create gauge charts for MAT Ratio and Release Ratio in a single figure
+    with measure('render_gauges', rows_in=len(gauge_df)):
+        st.plotly_chart(build_gauge_grid(gauge_df), use_container_width=True)
 
     if st.button("Home"):
         st.session_state.page = 'upload'
@@ -166,23 +470,15 @@ def show_pl_report_page():
     if 'sales_uploaded_file' not in st.session_state or 'uploaded_file' not in st.session_state or 'base_price_uploaded_file' not in st.session_state:
         st.error("Please upload all required files.")
         st.stop()  # Safely stop execution if files are missing
-    # Cache the loading of Excel files
-    @st.cache_data
-    def load_excel(file):
-        return pd.read_excel(file, sheet_name=None)
     # Load the uploaded files
     sales_file = st.session_state.sales_uploaded_file
     base_price_file = st.session_state.base_price_uploaded_file
-    # Load all sheets from the Sales report and base price with caching
-    try:
-        df1 = load_excel(sales_file)
-    except Exception as e:
-        st.error(f"Error loading Sales report: {e}")
-        st.stop()
+    # Profit/loss of every booking through the shared pipeline; the Sales report and base price
+    # are only loaded when it is not cached
     try:
-        df3 = load_excel(base_price_file)
+        profit_loss = load_profit_loss(sales_file, base_price_file)
     except Exception as e:
-        st.error(f"Error loading Base Price file: {e}")
+        st.error(f"Error loading Sales report or Base Price file: {e}")
         st.stop()
     # Sidebar for date selection
     st.sidebar.header("Select Date Range")
@@ -191,106 +487,31 @@ def show_pl_report_page():
     if start_date > end_date:
         st.error("Start Date must be before or equal to End Date.")
         st.stop()
-    # Cache the data filtering for 'infant' and 'child' types
-    @st.cache_data
-    def filter_infant_child(df_dict):
-        for sheet_name, df in df_dict.items():
-            if 'Type' in df.columns:
-                df_dict[sheet_name] = df[~df['Type'].isin(['infant', 'child'])]
-        return df_dict
-    df1 = filter_infant_child(df1)
-    # Cache dropping irrelevant columns
-    irrelevant_columns = ['SL NO', 'Title', 'First Name', 'Last Name', 'Booking Status', 'Carrier', 'Type',
-                          'DepTime', 'PNR', 'DOB', 'DMinusDays', 'Name Updated', 'Name Updated By', 
-                          'Name Updated On']
-    @st.cache_data
-    def drop_irrelevant_columns(df_dict):
-        for sheet_name, df in df_dict.items():
-            existing_columns = [col for col in irrelevant_columns if col in df.columns]
-            if existing_columns:
-                df.drop(columns=existing_columns, inplace=True)
-        return df_dict
-    df1 = drop_irrelevant_columns(df1)
-    # Cache sorting of the data by 'TravelDate'
-    @st.cache_data
-    def sort_by_travel_date(df_dict):
-        for sheet_name, df in df_dict.items():
-            if 'TravelDate' in df.columns:
-                df_dict[sheet_name] = df.sort_values(by='TravelDate')
-        return df_dict
-    df1 = sort_by_travel_date(df1)
-    # Cache formatting of the 'Sector' column
-    @st.cache_data
-    def format_sector(df_dict):
-        for sheet_name, df in df_dict.items():
-            if 'Sector' in df.columns:
-                df['Sector'] = df['Sector'].str.replace('-', '', regex=False).str.replace(' ', '', regex=False)
-        return df_dict
-    df1 = format_sector(df1)
-    # Cache saving of the modified sales report to a new Excel file in-memory
-    @st.cache_data
-    def save_modified_sales(df_dict):
-        modified_sales = BytesIO()
-        with pd.ExcelWriter(modified_sales, engine='openpyxl') as writer:
-            for sheet_name, df in df_dict.items():
-                if not df.empty:
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
-        modified_sales.seek(0)  # Reset the buffer to the beginning
-        return modified_sales
-    modified_sales = save_modified_sales(df1)
-    # Reload the modified Sales report
-    try:
-        new_df1 = pd.read_excel(modified_sales, sheet_name=None)
-    except Exception as e:
-        st.error(f"Error loading modified Sales report: {e}")
-        st.stop()
-    # Create an empty list to hold the results
-    temporary_data = []
-    # Cache filtering based on date range and profit/loss calculation
-    @st.cache_data
-    def calculate_profit_loss(new_df1, df3, start_date, end_date):
-        temporary_data = []
-        for sheet_name, df in new_df1.items():
-            if 'TravelDate' in df.columns:
-                filtered_df = df[(df['TravelDate'] >= start_date) & (df['TravelDate'] <= end_date)]
-                for _, row in filtered_df.iterrows():
-                    sector = row['Sector']
-                    flight_number = row['FlightNumber']
-                    amount = row['Amount']
-                    date = row['TravelDate']
-                    for base_sheet_name, base_df in df3.items():
-                        date_range = base_sheet_name.split('_')
-                        if len(date_range) != 2:
-                            continue
-                        try:
-                            sheet_start_date = pd.to_datetime(date_range[0])
-                            sheet_end_date = pd.to_datetime(date_range[1])
-                        except:
-                            continue
-                        if (sheet_start_date <= end_date) and (sheet_end_date >= start_date):
-                            base_row = base_df[base_df['Sector'] == sector]
-                            base = base_row['Base'].values[0] if not base_row.empty else None
-                            profit_loss = amount - base if base is not None else None
-                            temporary_data.append({
-                                'Sector': sector,
-                                'Date': date,
-                                'FlightNumber': flight_number,
-                                'Amount': amount,
-                                'Base': base,
-                                'Profit/Loss': profit_loss
-                            })
-                            break
-        return pd.DataFrame(temporary_data)
-    temporary_df = calculate_profit_loss(new_df1, df3, start_date, end_date)
+    temporary_df = slice_for_range(profit_loss, start_date, end_date)
     # Remove rows with NaN in 'Profit/Loss' column
     temporary_df = temporary_df.dropna(subset=['Profit/Loss'])
     # Display the temporary DataFrame
     st.write("Profit and Loss Data:")
     st.dataframe(temporary_df)
+    export_buttons(temporary_df, 'profit_loss')
     # Group by sector for aggregated Profit/Loss
-    new_df2 = temporary_df.groupby('Sector').agg({'Profit/Loss': 'sum', 'Base': 'sum', 'Amount': 'sum'}).reset_index()
+    new_df2 = profit_loss_by_sector(temporary_df)
     st.write("Profit and Loss Data by Sector:")
     st.dataframe(new_df2, use_container_width=True)
+    export_buttons(new_df2, 'profit_loss_by_sector')
+
+    # The cleaned Sales report is only written to Excel when the user asks for it. The request
+    # outlives the reruns spent loading the Sales report if it is no longer cached.
+    if st.button("Prepare cleaned Sales report"):
+        st.session_state['cleaned_sales_report'] = file_digest(sales_file)
+    if st.session_state.get('cleaned_sales_report') == file_digest(sales_file):
+        sales = load_sales_report(sales_file)
+        del st.session_state['cleaned_sales_report']
+        st.download_button("Download cleaned Sales report",
+                           data=run_stage('sales_report_xlsx', (file_digest(sales_file),),
+                                          lambda: save_modified_sales(sales), rows_in=row_count(sales)).getvalue(),
+                           file_name="modified_sales.xlsx",
+                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
     
     if st.button("Home"):
         st.session_state.page = 'upload'
@@ -301,23 +522,15 @@ def show_pl_analytics_page():
     if 'sales_uploaded_file' not in st.session_state or 'uploaded_file' not in st.session_state or 'base_price_uploaded_file' not in st.session_state:
         st.error("Please upload all required files.")
         st.stop()  # Safely stop execution if files are missing
-    # Cache the loading of Excel files
-    @st.cache_data
-    def load_excel(file):
-        return pd.read_excel(file, sheet_name=None)
     # Load the uploaded files
     sales_file = st.session_state.sales_uploaded_file
     base_price_file = st.session_state.base_price_uploaded_file
-    # Load all sheets from the Sales report and base price with caching
-    try:
-        df1 = load_excel(sales_file)
-    except Exception as e:
-        st.error(f"Error loading Sales report: {e}")
-        st.stop()
+    # Daily totals through the shared pipeline; the Sales report and base price are only
+    # loaded when they are not cached
     try:
-        df3 = load_excel(base_price_file)
+        daily_cube = load_daily_cube(sales_file, base_price_file)
     except Exception as e:
-        st.error(f"Error loading Base Price file: {e}")
+        st.error(f"Error loading Sales report or Base Price file: {e}")
         st.stop()
     # Sidebar for date selection
     st.sidebar.header("Select Date Range")
@@ -326,101 +539,9 @@ def show_pl_analytics_page():
     if start_date > end_date:
         st.error("Start Date must be before or equal to End Date.")
         st.stop()
-    # Cache the data filtering for 'infant' and 'child' types
-    @st.cache_data
-    def filter_infant_child(df_dict):
-        for sheet_name, df in df_dict.items():
-            if 'Type' in df.columns:
-                df_dict[sheet_name] = df[~df['Type'].isin(['infant', 'child'])]
-        return df_dict
-    df1 = filter_infant_child(df1)
-    # Cache dropping irrelevant columns
-    irrelevant_columns = ['SL NO', 'Title', 'First Name', 'Last Name', 'Booking Status', 'Carrier', 'Type',
-                          'DepTime', 'PNR', 'DOB', 'DMinusDays', 'Name Updated', 'Name Updated By', 
-                          'Name Updated On']
-    @st.cache_data
-    def drop_irrelevant_columns(df_dict):
-        for sheet_name, df in df_dict.items():
-            existing_columns = [col for col in irrelevant_columns if col in df.columns]
-            if existing_columns:
-                df.drop(columns=existing_columns, inplace=True)
-        return df_dict
-    df1 = drop_irrelevant_columns(df1)
-    # Cache sorting of the data by 'TravelDate'
-    @st.cache_data
-    def sort_by_travel_date(df_dict):
-        for sheet_name, df in df_dict.items():
-            if 'TravelDate' in df.columns:
-                df_dict[sheet_name] = df.sort_values(by='TravelDate')
-        return df_dict
-    df1 = sort_by_travel_date(df1)
-    # Cache formatting of the 'Sector' column
-    @st.cache_data
-    def format_sector(df_dict):
-        for sheet_name, df in df_dict.items():
-            if 'Sector' in df.columns:
-                df['Sector'] = df['Sector'].str.replace('-', '', regex=False).str.replace(' ', '', regex=False)
-        return df_dict
-    df1 = format_sector(df1)
-    # Cache saving of the modified sales report to a new Excel file in-memory
-    @st.cache_data
-    def save_modified_sales(df_dict):
-        modified_sales = BytesIO()
-        with pd.ExcelWriter(modified_sales, engine='openpyxl') as writer:
-            for sheet_name, df in df_dict.items():
-                if not df.empty:
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
-        modified_sales.seek(0)  # Reset the buffer to the beginning
-        return modified_sales
-    modified_sales = save_modified_sales(df1)
-    # Reload the modified Sales report
-    try:
-        new_df1 = pd.read_excel(modified_sales, sheet_name=None)
-    except Exception as e:
-        st.error(f"Error loading modified Sales report: {e}")
-        st.stop()
-    # Create an empty list to hold the results
-    temporary_data = []
-    # Cache filtering based on date range and profit/loss calculation
-    @st.cache_data
-    def calculate_profit_loss(new_df1, df3, start_date, end_date):
-        temporary_data = []
-        for sheet_name, df in new_df1.items():
-            if 'TravelDate' in df.columns:
-                filtered_df = df[(df['TravelDate'] >= start_date) & (df['TravelDate'] <= end_date)]
-                for _, row in filtered_df.iterrows():
-                    sector = row['Sector']
-                    flight_number = row['FlightNumber']
-                    amount = row['Amount']
-                    date = row['TravelDate']
-                    for base_sheet_name, base_df in df3.items():
-                        date_range = base_sheet_name.split('_')
-                        if len(date_range) != 2:
-                            continue
-                        try:
-                            sheet_start_date = pd.to_datetime(date_range[0])
-                            sheet_end_date = pd.to_datetime(date_range[1])
-                        except:
-                            continue
-                        if (sheet_start_date <= end_date) and (sheet_end_date >= start_date):
-                            base_row = base_df[base_df['Sector'] == sector]
-                            base = base_row['Base'].values[0] if not base_row.empty else None
-                            profit_loss = amount - base if base is not None else None
-                            temporary_data.append({
-                                'Sector': sector,
-                                'Date': date,
-                                'FlightNumber': flight_number,
-                                'Amount': amount,
-                                'Base': base,
-                                'Profit/Loss': profit_loss
-                            })
-                            break
-        return pd.DataFrame(temporary_data)
-    
-    temporary_df = calculate_profit_loss(new_df1, df3, start_date, end_date)
-    # Remove rows with NaN in 'Profit/Loss' column
-
-    new_df2 = temporary_df.groupby('Sector').agg({'Profit/Loss': 'sum', 'Base': 'sum', 'Amount': 'sum'}).reset_index()
+    # KPIs and charts read from the daily cube rather than the individual bookings
+    cube = slice_for_range(daily_cube, start_date, end_date)
+    new_df2 = sector_totals(cube)
        
     st.markdown("<h2 style='text-align: center;'>KPIs</h2>", unsafe_allow_html=True)
     # To add space between the KPIs title and actual figures
@@ -431,8 +552,8 @@ def show_pl_analytics_page():
     total_sales = new_df2['Amount'].sum()
     total_profit = new_df2['Profit/Loss'].sum()
     average_profit = total_profit / len(new_df2)
-    num_flights = len(temporary_df['FlightNumber'].unique())
-    num_sectors = len(temporary_df['Sector'].unique())
+    num_flights = len(cube['FlightNumber'].unique())
+    num_sectors = len(cube['Sector'].unique())
 
     col1, col2 = st.columns(2, gap="large")
     with col1:
@@ -453,32 +574,103 @@ def show_pl_analytics_page():
         st.empty() 
     
     st.markdown("<h2 style='text-align: center;'>Sector Performance Analytics</h2>", unsafe_allow_html=True)
-    top_sectors = new_df2.sort_values(by='Profit/Loss', ascending=False).head(5)
-    
-    fig = px.pie(top_sectors, values='Profit/Loss', names='Sector', title='Top 5 Performing Sectors')
-    st.plotly_chart(fig, use_container_width=True)
-    
+    with measure('render_charts', rows_in=len(cube)):
+        st.plotly_chart(top_sectors_pie(new_df2), use_container_width=True)
+        st.plotly_chart(bottom_sectors_bar(new_df2), use_container_width=True)
+        st.plotly_chart(sector_profit_bar(new_df2), use_container_width=True)
+        st.plotly_chart(profit_trend_line(cube), use_container_width=True)
 
-    bottom_sectors = new_df2.sort_values(by='Profit/Loss', ascending=True).head(5)
+    if st.button("Home"):
+        st.session_state.page = 'upload'
+
+
+# Seats and revenue side by side: revenue per sold seat, margin vs load factor and unsold-seat exposure
+def show_combined_analytics_page():
+    st.markdown("<h2 style='text-align: center;'>Seats and Revenue Analytics</h2>", unsafe_allow_html=True)
+    # Check if the files are uploaded
+    if 'sales_uploaded_file' not in st.session_state or 'uploaded_file' not in st.session_state or 'base_price_uploaded_file' not in st.session_state:
+        st.error("Please upload all required files.")
+        st.stop()  # Safely stop execution if files are missing
+    inventory_file = st.session_state.uploaded_file
+    sales_file = st.session_state.sales_uploaded_file
+    base_price_file = st.session_state.base_price_uploaded_file
+    try:
+        joined = load_inventory_profit_loss(inventory_file, sales_file, base_price_file)
+    except Exception as e:
+        st.error(f"Error loading the uploaded files: {e}")
+        st.stop()
+    # Sidebar for date selection
+    st.sidebar.header("Select Date Range")
+    start_date = pd.to_datetime(st.sidebar.date_input("Start Date", key='start_date'))
+    end_date = pd.to_datetime(st.sidebar.date_input("End Date", key='end_date'))
+    if start_date > end_date:
+        st.error("Start Date must be before or equal to End Date.")
+        st.stop()
+    joined = slice_for_range(joined, start_date, end_date)
+    sector_df = combined_by_sector(joined)
+    total = sector_df[['Total Seats', 'Sold Seats', 'Unsold Seats', 'Sold Seats with Sales', 'Amount',
+                       'Priced Amount', 'Profit/Loss', 'Unsold Exposure']].sum()
+
+    col1, col2 = st.columns(2, gap="large")
+    with col1:
+        revenue_per_seat = total['Amount'] / total['Sold Seats with Sales'] if total['Sold Seats with Sales'] else 0
+        st.metric("Revenue per Sold Seat", f"₹{revenue_per_seat:,.2f}")
+    with col2:
+        load_factor = total['Sold Seats'] / total['Total Seats'] * 100 if total['Total Seats'] else 0
+        st.metric("Load Factor", f"{load_factor:.1f}%")
+    col3, col4 = st.columns(2, gap="large")
+    with col3:
+        margin = total['Profit/Loss'] / total['Priced Amount'] * 100 if total['Priced Amount'] else 0
+        st.metric("Margin", f"{margin:.1f}%")
+    with col4:
+        st.metric("Unsold-Seat Exposure", f"₹{total['Unsold Exposure']:,.2f}")
+    st.caption(f"{(joined['Bookings'] > 0).sum():,} of {len(joined):,} inventory flight-days have bookings "
+               "in the Sales report.")
+
+    st.write("Seats and Revenue by Sector:")
+    st.dataframe(sector_df, use_container_width=True)
+    export_buttons(sector_df, 'seats_revenue_by_sector')
+    with measure('render_charts', rows_in=len(joined)):
+        st.plotly_chart(margin_load_factor_scatter(sector_df), use_container_width=True)
+        st.plotly_chart(margin_by_load_band_bar(margin_by_load_factor(joined)), use_container_width=True)
+        st.plotly_chart(unsold_exposure_bar(sector_df), use_container_width=True)
+    st.write("Seats and Revenue by Flight:")
+    st.dataframe(joined)
+    export_buttons(joined, 'seats_revenue_by_flight')
 
-   # Bar chart showing both negative (loss) and positive (profit)
-    fig = px.bar(bottom_sectors, x='Sector', y='Profit/Loss', title='Bottom 5 Performing Sectors')
-    st.plotly_chart(fig, use_container_width=True)
-    
-    fig = px.bar(new_df2, x='Sector', y='Profit/Loss',title='Profit/Loss by Sector')
-    st.plotly_chart(fig, use_container_width=True)
-    
-    fig = px.line(temporary_df, x= 'Date', y='Profit/Loss', color='Sector', title='Profit/Loss trend across sectors')
-    st.plotly_chart(fig, use_container_width=True)
-    
-    
-    
     if st.button("Home"):
         st.session_state.page = 'upload'
 
+# Optional debug panel listing the metrics of every stage measured during this run
+def show_metrics_panel():
+    records = run_records()
+    if not records:
+        st.sidebar.caption("No pipeline stages ran.")
+        return
+    metrics_df = pd.DataFrame(records)
+    # Nested stages are indented under the stage that called them and already counted in its time
+    total_seconds = metrics_df.loc[metrics_df['depth'] == 0, 'seconds'].sum()
+    metrics_df['stage'] = ['  ' * depth + stage for depth, stage in zip(metrics_df['depth'], metrics_df['stage'])]
+    metrics_df = metrics_df[['stage', 'cache', 'seconds', 'rows_in', 'rows_out', 'peak_rss_delta_mb']]
+    st.sidebar.dataframe(metrics_df, hide_index=True, use_container_width=True)
+    st.sidebar.caption(f"Total {total_seconds:.2f}s, "
+                       f"pipeline cache {get_pipeline_cache().total_bytes / 1024 / 1024:,.1f} MB")
 
 # Run the app
 def render_page():
+  start_run(page=st.session_state.page)
+  show_metrics = st.session_state.page != 'upload' and st.sidebar.checkbox("Show performance metrics",
+                                                                           key='show_metrics')
+  st.session_state['run_results'] = {}
+  try:
+    render_page_body()
+  finally:
+    del st.session_state['run_results']
+    release_finished_jobs()
+    if show_metrics:
+      show_metrics_panel()
+
+def render_page_body():
   if st.session_state.page == 'upload':
     show_upload_page()
   elif st.session_state.page == 'inventory_report':
@@ -487,6 +679,8 @@ def render_page():
     show_pl_report_page()
   elif st.session_state.page == 'pl_analytics':
     show_pl_analytics_page()
+  elif st.session_state.page == 'combined_analytics':
+    show_combined_analytics_page()
   else:
     st.error("Invalid page")
 
@@ -0,0 +1,64 @@
+# Compare the openpyxl and calamine xlsx backends on the bundled workbooks.
+#
+# Each workbook is parsed with every engine the given number of times; the
+# script checks that all engines return identical frames and prints the best
+# wall time per engine and the speedup over openpyxl:
+#
+#   python benchmarks/excel_engines.py [--repeat 3] [workbook.xlsx ...]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_engine import open_workbook, resolve_excel_engine  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WORKBOOKS = [os.path.join(REPO_DIR, 'Inventory report.xlsx'), os.path.join(REPO_DIR, 'Base price.xlsx')]
+
+
+def parse_all_sheets(data, engine):
+    excel_file = open_workbook(data, engine)
+    return {sheet_name: excel_file.parse(sheet_name) for sheet_name in excel_file.sheet_names}
+
+
+def best_time(data, engine, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        sheets = parse_all_sheets(data, engine)
+        timings.append(time.perf_counter() - started)
+    return min(timings), sheets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the xlsx reader backends.")
+    parser.add_argument('workbooks', nargs='*', default=DEFAULT_WORKBOOKS)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    engines = ['openpyxl']
+    if resolve_excel_engine('auto') == 'calamine':
+        engines.append('calamine')
+    else:
+        print("python-calamine is not installed; only openpyxl is measured.")
+
+    mismatches = 0
+    for path in args.workbooks:
+        with open(path, 'rb') as workbook:
+            data = workbook.read()
+        results = {engine: best_time(data, engine, args.repeat) for engine in engines}
+        baseline_time, baseline_sheets = results['openpyxl']
+        print(f"{os.path.basename(path)} ({len(data) / 1024 / 1024:.1f} MB)")
+        for engine, (elapsed, sheets) in results.items():
+            identical = sheets.keys() == baseline_sheets.keys() and all(
+                sheets[name].equals(baseline_sheets[name]) for name in sheets)
+            mismatches += not identical
+            print(f"  {engine:<9} {elapsed:8.3f} s  {baseline_time / elapsed:5.1f}x  "
+                  f"{'identical' if identical else 'DIFFERENT OUTPUT'}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# Time every report path on synthetic workbooks and record the results as JSON.
+#
+# The stages are timed separately: ingestion, preprocessing, the P/L calculation,
+# the sector groupbys, the inventory and P/L join and chart construction. Each stage records its wall time and
+# the peak memory traced by tracemalloc. Tracing slows Python-heavy stages down, so
+# use --no-memory when only the timings matter. Runs can be compared with --compare:
+#
+#   python benchmarks/report_paths.py --scale small --output small.json
+#   python benchmarks/report_paths.py --bookings 500000 --sectors 100 --fare-sheets 12 --output run.json
+#   python benchmarks/report_paths.py --scale small --output new.json --compare small.json
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import report_engine  # noqa: E402
+from benchmarks.synthetic import generate_dataset  # noqa: E402
+from report_charts import (bottom_sectors_bar, build_gauge_grid, profit_trend_line, sector_profit_bar,  # noqa: E402
+                           select_gauge_sectors, top_sectors_pie)
+from report_engine import (BASE_PRICE_SCHEMA, INVENTORY_SCHEMA, SALES_KEYS, SALES_SCHEMA,  # noqa: E402
+                           apply_schema_to_sheets, build_base_price_index, build_daily_cube, calculate_profit_loss,
+                           clean_sales_sheets, combined_by_sector, content_digest, inventory_by_sector,
+                           join_inventory_profit_loss, margin_by_load_factor, process_inventory_report,
+                           ratios_by_sector, read_sales_streaming, read_workbook_cached, run_per_sheet,
+                           schema_columns, sector_totals, share_key_dictionaries, slice_by_date)
+
+SCALES = {
+    'small': {'bookings': 10_000, 'sectors': 10, 'fare_sheets': 1},
+    'medium': {'bookings': 500_000, 'sectors': 100, 'fare_sheets': 12},
+    'large': {'bookings': 5_000_000, 'sectors': 500, 'fare_sheets': 60},
+}
+
+
+TRACE_MEMORY = True
+
+
+# Run one stage, recording its wall time, peak traced memory and output size
+def timed(results, stage, func, *args):
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    started = time.perf_counter()
+    value = func(*args)
+    elapsed = time.perf_counter() - started
+    peak_mb = None
+    if TRACE_MEMORY:
+        peak_mb = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        tracemalloc.stop()
+    rows = _row_count(value)
+    results[stage] = {'seconds': round(elapsed, 4), 'peak_mb': peak_mb, 'rows': rows}
+    memory = f"{peak_mb:10.1f} MB" if peak_mb is not None else f"{'-':>10}   "
+    print(f"  {stage:<28} {elapsed:9.3f} s {memory}  {rows if rows is not None else '-'} rows")
+    return value
+
+
+def _row_count(value):
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_row_count(item) for item in value.values())
+    return None
+
+
+def _merge_sheets(sheet_dicts):
+    merged = {}
+    for sheet_dict in sheet_dicts:
+        merged.update(sheet_dict)
+    return merged
+
+
+def run_benchmark(datasets):
+    stages = {}
+    inventory, sales, base_price = datasets['inventory'], datasets['sales'], datasets['base_price']
+
+    print("Ingestion")
+    if len(sales) >= report_engine.STREAMING_SALES_MIN_MB * 1024 * 1024:
+        raw_sales = timed(stages, 'ingest_sales_streaming', read_sales_streaming, sales)
+    else:
+        raw_sales = timed(stages, 'ingest_sales', read_workbook_cached, sales, content_digest(sales), None,
+                          schema_columns(SALES_SCHEMA))
+    raw_inventory = timed(stages, 'ingest_inventory', read_workbook_cached, inventory, content_digest(inventory), 0,
+                          schema_columns(INVENTORY_SCHEMA))
+    raw_base_price = timed(stages, 'ingest_base_price', read_workbook_cached, base_price, content_digest(base_price),
+                           None, schema_columns(BASE_PRICE_SCHEMA))
+
+    print("Preprocessing")
+    new_df1 = timed(stages, 'preprocess_sales', lambda: share_key_dictionaries(
+        _merge_sheets(run_per_sheet(clean_sales_sheets, raw_sales)), list(SALES_KEYS)))
+    df2 = timed(stages, 'preprocess_inventory', process_inventory_report, raw_inventory)
+    base_index = timed(stages, 'build_base_price_index',
+                       lambda: build_base_price_index(apply_schema_to_sheets(raw_base_price, BASE_PRICE_SCHEMA)))
+
+    print("Profit and loss")
+    temporary_df = timed(stages, 'calculate_profit_loss', calculate_profit_loss, new_df1, base_index)
+    dates = temporary_df['Date']
+    if len(dates):
+        middle = dates.iloc[len(dates) // 2]
+        timed(stages, 'slice_one_month', slice_by_date, temporary_df, middle - pd.Timedelta(days=15),
+              middle + pd.Timedelta(days=15))
+
+    print("Sector groupbys")
+    timed(stages, 'inventory_by_sector', inventory_by_sector, df2)
+    grouped_df = timed(stages, 'ratios_by_sector', ratios_by_sector, df2)
+    cube = timed(stages, 'build_daily_cube', build_daily_cube, temporary_df)
+    new_df2 = timed(stages, 'sector_totals', sector_totals, cube)
+
+    print("Inventory and P/L join")
+    joined = timed(stages, 'join_inventory_profit_loss', join_inventory_profit_loss, df2, temporary_df)
+    timed(stages, 'combined_by_sector', combined_by_sector, joined)
+    timed(stages, 'margin_by_load_factor', margin_by_load_factor, joined)
+
+    print("Charts")
+    timed(stages, 'gauge_grid_worst_10',
+          lambda: build_gauge_grid(select_gauge_sectors(grouped_df, "Worst by MAT Ratio", 10)))
+    timed(stages, 'gauge_grid_all', build_gauge_grid, grouped_df)
+    timed(stages, 'sector_charts', lambda: [top_sectors_pie(new_df2), bottom_sectors_bar(new_df2),
+                                            sector_profit_bar(new_df2)])
+    timed(stages, 'profit_trend_line', profit_trend_line, cube)
+    return stages
+
+
+# Print the change of every stage against an earlier result file
+def compare(current, previous):
+    print(f"\nCompared with {previous['label']} ({previous['timestamp']})")
+    for stage, result in current['stages'].items():
+        before = previous['stages'].get(stage)
+        if before is None or not before['seconds']:
+            print(f"  {stage:<28} new")
+            continue
+        ratio = result['seconds'] / before['seconds']
+        memory = ''
+        if result['peak_mb'] is not None and before['peak_mb'] is not None:
+            memory = f"  peak {result['peak_mb'] - before['peak_mb']:+.1f} MB"
+        print(f"  {stage:<28} {before['seconds']:9.3f} s -> {result['seconds']:9.3f} s ({ratio:5.2f}x){memory}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the report paths on synthetic workbooks.")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--bookings', type=int, help="overrides the scale's number of bookings")
+    parser.add_argument('--sectors', type=int, help="overrides the scale's number of sectors")
+    parser.add_argument('--fare-sheets', type=int, help="overrides the scale's number of base price sheets")
+    parser.add_argument('--inventory-rows', type=int, help="defaults to one flight-day per 20 bookings")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--disk-cache', action='store_true',
+                        help="keep the on-disk sheet cache enabled (ingestion then measures cache reads)")
+    parser.add_argument('--no-memory', action='store_true', help="skip memory tracing for undistorted timings")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    parser.add_argument('--label', help="name stored with the results; defaults to the scale")
+    args = parser.parse_args(argv)
+
+    scale = dict(SCALES[args.scale])
+    for name in ('bookings', 'sectors', 'fare_sheets'):
+        if getattr(args, name) is not None:
+            scale[name] = getattr(args, name)
+    scale['inventory_rows'] = args.inventory_rows
+    if not args.disk_cache:
+        report_engine.DISK_CACHE_MAX_MB = 0
+    global TRACE_MEMORY
+    TRACE_MEMORY = not args.no_memory
+
+    print(f"Generating workbooks: {scale}")
+    started = time.perf_counter()
+    datasets = generate_dataset(scale['bookings'], scale['sectors'], scale['fare_sheets'],
+                                inventory_rows=scale['inventory_rows'], seed=args.seed)
+    print(f"  generated in {time.perf_counter() - started:.1f} s, "
+          + ", ".join(f"{name} {len(data) / 1024 / 1024:.1f} MB" for name, data in datasets.items()))
+
+    results = {
+        'label': args.label or args.scale,
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'scale': scale,
+        'excel_engine': report_engine.resolve_excel_engine(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'stages': run_benchmark(datasets),
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(results, json.load(previous_file))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# Synthetic inventory, sales and base price workbooks shaped like the real exports.
+#
+# Sizes are configurable from a few thousand bookings up to millions. Rows are
+# streamed into openpyxl's write-only mode, so even large workbooks are written
+# without building a cell model. Sales sheets are split by month and capped
+# below Excel's row limit.
+import datetime
+from io import BytesIO
+
+import numpy as np
+import openpyxl
+
+# Excel allows 1,048,576 rows per sheet, including the header
+MAX_SHEET_ROWS = 1_000_000
+
+AIRPORTS = ['AMD', 'AYJ', 'BBI', 'BLR', 'BOM', 'CCU', 'COK', 'DEL', 'GAU', 'GOP', 'GOX', 'GWL', 'HYD', 'IXA',
+            'IXB', 'IXD', 'IXZ', 'LKO', 'MAA', 'PNQ', 'SXR', 'VNS', 'JAI', 'IDR', 'NAG', 'PAT', 'RPR', 'TRV',
+            'VTZ', 'IXC']
+
+
+def make_sectors(count, rng):
+    # Every ordered airport pair is a sector; take a random subset of the requested size
+    pairs = [(origin, destination) for origin in AIRPORTS for destination in AIRPORTS if origin != destination]
+    if count > len(pairs):
+        raise ValueError(f"at most {len(pairs)} sectors can be generated")
+    chosen = rng.choice(len(pairs), size=count, replace=False)
+    return [pairs[i] for i in sorted(chosen)]
+
+
+def _workbook_bytes(sheets):
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_name, header, rows in sheets:
+        worksheet = workbook.create_sheet(title=sheet_name)
+        worksheet.append(header)
+        for row in rows:
+            worksheet.append(row)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _to_datetimes(days, start):
+    return [start + datetime.timedelta(days=int(day)) for day in days]
+
+
+# Base price workbook with one "<start>_<end>" sheet per fare period covering the whole span
+def base_price_workbook(sectors, fare_sheets, start, days, rng):
+    bounds = np.linspace(0, days, fare_sheets + 1).astype(int)
+    sheets = []
+    for period in range(fare_sheets):
+        valid_from = start + datetime.timedelta(days=int(bounds[period]))
+        valid_to = start + datetime.timedelta(days=int(bounds[period + 1]) - 1)
+        prices = rng.integers(15, 60, size=len(sectors)) * 100
+        rows = ([origin + destination, int(price)] for (origin, destination), price in zip(sectors, prices))
+        sheet_name = f"{valid_from:%Y-%m-%d}_{valid_to:%Y-%m-%d}"
+        sheets.append((sheet_name, ['Sector', 'Base'], rows))
+    return _workbook_bytes(sheets)
+
+
+SALES_HEADER = ['SL NO', 'Title', 'First Name', 'Last Name', 'Booking Status', 'Carrier', 'Type', 'TravelDate',
+                'DepTime', 'Sector', 'FlightNumber', 'PNR', 'DOB', 'DMinusDays', 'Amount', 'Name Updated',
+                'Name Updated By', 'Name Updated On']
+
+
+def _sales_rows(count, sectors, flights, start, days, rng):
+    travel_days = np.sort(rng.integers(0, days, size=count))
+    sector_ids = rng.integers(0, len(sectors), size=count)
+    passenger_types = rng.choice(['adult', 'adult', 'adult', 'child', 'infant'], size=count)
+    amounts = rng.integers(1000, 9000, size=count)
+    travel_dates = _to_datetimes(travel_days, start)
+    for i in range(count):
+        origin, destination = sectors[sector_ids[i]]
+        yield [i + 1, 'MR', 'Test', 'Passenger', 'Confirmed', 'QP', passenger_types[i], travel_dates[i], 1230,
+               f'{origin}-{destination}', int(flights[sector_ids[i]]), 'ABC123', datetime.datetime(1990, 1, 1),
+               3, int(amounts[i]), 'No', None, None]
+
+
+# Sales workbook with the bookings spread over month-sized sheets of at most MAX_SHEET_ROWS rows
+def sales_workbook(bookings, sectors, flights, start, days, rng):
+    months = max(1, days // 30)
+    per_sheet = -(-bookings // months)
+    sheet_sizes = []
+    remaining = bookings
+    while remaining > 0:
+        size = min(per_sheet, MAX_SHEET_ROWS, remaining)
+        sheet_sizes.append(size)
+        remaining -= size
+    sheet_sizes = sheet_sizes or [0]
+    sheets = []
+    for index, size in enumerate(sheet_sizes):
+        first_day = index * days // len(sheet_sizes)
+        last_day = (index + 1) * days // len(sheet_sizes)
+        rows = _sales_rows(size, sectors, flights, start + datetime.timedelta(days=first_day),
+                           max(last_day - first_day, 1), rng)
+        sheets.append((f'Sales {index + 1}', SALES_HEADER, rows))
+    return _workbook_bytes(sheets)
+
+
+INVENTORY_HEADER = ['DayWise Id', 'Coupon Id', 'Flight Number', 'Sector', 'Dep Date', 'Dep Time', 'Arr Date',
+                    'Arr Time', 'Starting Price', 'Total Fare', 'Total Seat', 'Current Seat', 'PNR', 'Series Owner']
+
+
+def _inventory_rows(count, sectors, flights, start, days, rng):
+    sector_ids = rng.integers(0, len(sectors), size=count)
+    dep_days = rng.integers(0, days, size=count)
+    total_seats = rng.integers(0, 60, size=count)
+    unsold = (total_seats * rng.random(size=count)).astype(int)
+    dep_dates = _to_datetimes(dep_days, start)
+    for i in range(count):
+        origin, destination = sectors[sector_ids[i]]
+        yield [i + 1, 10, f'QP-{flights[sector_ids[i]]}', f'{origin}-{destination}', dep_dates[i], 2230,
+               dep_dates[i] + datetime.timedelta(days=1), 35, 5800, 5800.0, int(total_seats[i]), int(unsold[i]),
+               'P7T92G', '-B']
+
+
+def inventory_workbook(rows, sectors, flights, start, days, rng):
+    return _workbook_bytes([('Sheet1', INVENTORY_HEADER, _inventory_rows(rows, sectors, flights, start, days, rng))])
+
+
+# Generate all three workbooks for one scale; returns a dict of workbook bytes
+def generate_dataset(bookings, sectors, fare_sheets, inventory_rows=None, days=365, seed=0,
+                     start=datetime.datetime(2024, 1, 1)):
+    rng = np.random.default_rng(seed)
+    sector_pairs = make_sectors(sectors, rng)
+    # One flight number per sector, shared by the inventory and the bookings so the two can be joined
+    flights = rng.integers(1000, 2000, size=sectors)
+    inventory_rows = inventory_rows if inventory_rows is not None else max(bookings // 20, sectors)
+    return {
+        'inventory': inventory_workbook(inventory_rows, sector_pairs, flights, start, days, rng),
+        'sales': sales_workbook(bookings, sector_pairs, flights, start, days, rng),
+        'base_price': base_price_workbook(sector_pairs, fare_sheets, start, days, rng),
+    }
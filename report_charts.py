@@ -0,0 +1,76 @@
+# Plotly figures of the inventory and P/L analytics pages. Kept free of Streamlit
+# so the benchmarks can time chart construction on their own.
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Gauge shared by the MAT Ratio and Release Ratio indicators
+def ratio_gauge(value, title, domain=None):
+    return go.Indicator(
+        mode="gauge+number",
+        domain=domain,
+        value=value,
+        title={'text': title, 'font': {'color': "silver"}},
+        gauge={
+            'axis': {'range': [0, 100]},
+            'bar': {'color': "black"},
+            'steps': [
+                {'range': [0, 50], 'color': "crimson"},
+                {'range': [50, 100], 'color': "lightgreen"},
+            ],
+        }
+    )
+
+# Pick the sectors whose gauges are rendered: the worst or top N by MAT Ratio, or all of them
+def select_gauge_sectors(grouped_df, order, count):
+    if order == "Worst by MAT Ratio":
+        return grouped_df.nsmallest(count, 'MAT_Ratio')
+    if order == "Top by MAT Ratio":
+        return grouped_df.nlargest(count, 'MAT_Ratio')
+    return grouped_df
+
+# All MAT Ratio / Release Ratio gauges in one figure, one row per sector, built in a single pass.
+# Each gauge gets its own domain, which avoids make_subplots' per-trace overhead.
+def build_gauge_grid(grouped_df, row_height=260):
+    rows = max(len(grouped_df), 1)
+    gap = 0.15 / rows
+    traces = []
+    for row, (sector, mat_ratio, release_ratio) in enumerate(
+            zip(grouped_df['Sector'], grouped_df['MAT_Ratio'], grouped_df['Release Ratio'])):
+        y_domain = [1 - (row + 1) / rows + gap, 1 - row / rows - gap]
+        traces.append(ratio_gauge(mat_ratio, f"MAT Ratio for {sector}", {'x': [0, 0.45], 'y': y_domain}))
+        traces.append(ratio_gauge(release_ratio, f"Release Ratio for {sector}", {'x': [0.55, 1], 'y': y_domain}))
+    fig = go.Figure(data=traces)
+    fig.update_layout(height=row_height * rows, margin={'t': 60, 'b': 20})
+    return fig
+
+def top_sectors_pie(new_df2, count=5):
+    top_sectors = new_df2.sort_values(by='Profit/Loss', ascending=False).head(count)
+    return px.pie(top_sectors, values='Profit/Loss', names='Sector', title=f'Top {count} Performing Sectors')
+
+# Bar chart showing both negative (loss) and positive (profit)
+def bottom_sectors_bar(new_df2, count=5):
+    bottom_sectors = new_df2.sort_values(by='Profit/Loss', ascending=True).head(count)
+    return px.bar(bottom_sectors, x='Sector', y='Profit/Loss', title=f'Bottom {count} Performing Sectors')
+
+def sector_profit_bar(new_df2):
+    return px.bar(new_df2, x='Sector', y='Profit/Loss', title='Profit/Loss by Sector')
+
+# Daily Profit/Loss per sector, read from the (day, sector, flight) cube
+def profit_trend_line(cube):
+    daily_sector_df = cube.groupby(['Date', 'Sector'], observed=True)['Profit/Loss'].sum().reset_index()
+    return px.line(daily_sector_df, x='Date', y='Profit/Loss', color='Sector', title='Profit/Loss trend across sectors')
+
+# Margin against load factor per sector, sized by revenue
+def margin_load_factor_scatter(sector_df):
+    priced = sector_df.dropna(subset=['Margin %', 'Load Factor'])
+    return px.scatter(priced, x='Load Factor', y='Margin %', size='Amount', hover_name='Sector',
+                      hover_data=['Revenue per Sold Seat', 'Bookings'], title='Margin vs Load Factor by Sector')
+
+def margin_by_load_band_bar(band_df):
+    return px.bar(band_df, x='Load Factor Band', y='Margin %', hover_data=['Flights', 'Amount'],
+                  title='Margin by Load Factor Band')
+
+def unsold_exposure_bar(sector_df, count=10):
+    exposed = sector_df.sort_values(by='Unsold Exposure', ascending=False).head(count)
+    return px.bar(exposed, x='Sector', y='Unsold Exposure', hover_data=['Unsold Seats', 'Load Factor'],
+                  title=f'Top {count} Sectors by Unsold-Seat Exposure')
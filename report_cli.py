@@ -0,0 +1,130 @@
+# Headless batch runner for the inventory and P/L reports.
+#
+# Each --files option names one (inventory, sales, base price) set of workbooks.
+# Sets are processed in parallel across worker processes and every set writes
+# its reports as CSV files into its own folder under --output-dir:
+#
+#   python report_cli.py --files "Inventory report.xlsx" sales.xlsx "Base price.xlsx" \
+#       --start 2024-03-01 --end 2024-05-31 --output-dir reports --workers 4
+#
+# With a single large file set, --sheet-workers spreads its sheets over processes instead.
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from report_engine import (build_daily_cube, calculate_profit_loss, combined_by_sector, inventory_by_sector,
+                           join_inventory_profit_loss, profit_loss_by_sector, read_base_price_index,
+                           read_inventory_report, read_sales_report, sector_totals, slice_by_date)
+
+
+def _read_bytes(path):
+    with open(path, 'rb') as workbook:
+        return workbook.read()
+
+
+# Run every report for one file set and write them to output_dir; returns a short summary
+def generate_reports(inventory_path, sales_path, base_price_path, output_dir, start_date=None, end_date=None,
+                     sheet_workers=0):
+    os.makedirs(output_dir, exist_ok=True)
+
+    df2 = read_inventory_report(_read_bytes(inventory_path))
+    df2.to_csv(os.path.join(output_dir, 'inventory_report.csv'), index=False)
+    inventory_by_sector(df2).to_csv(os.path.join(output_dir, 'inventory_by_sector.csv'), index=False)
+
+    temporary_df = calculate_profit_loss(read_sales_report(_read_bytes(sales_path), workers=sheet_workers),
+                                         read_base_price_index(_read_bytes(base_price_path), workers=sheet_workers),
+                                         workers=sheet_workers)
+    joined = join_inventory_profit_loss(df2, temporary_df)
+    if start_date is not None or end_date is not None:
+        start_date = start_date if start_date is not None else pd.Timestamp.min
+        end_date = end_date if end_date is not None else pd.Timestamp.max
+        temporary_df = slice_by_date(temporary_df, start_date, end_date)
+        joined = slice_by_date(joined, start_date, end_date)
+    priced_df = temporary_df.dropna(subset=['Profit/Loss'])
+    priced_df.to_csv(os.path.join(output_dir, 'profit_loss.csv'), index=False)
+    profit_loss_by_sector(temporary_df).to_csv(os.path.join(output_dir, 'profit_loss_by_sector.csv'), index=False)
+    cube = build_daily_cube(temporary_df)
+    cube.to_csv(os.path.join(output_dir, 'daily_sector_cube.csv'), index=False)
+    joined.to_csv(os.path.join(output_dir, 'inventory_profit_loss.csv'), index=False)
+    combined_by_sector(joined).to_csv(os.path.join(output_dir, 'inventory_profit_loss_by_sector.csv'), index=False)
+
+    sector_df = sector_totals(cube)
+    return {
+        'output_dir': output_dir,
+        'inventory_rows': len(df2),
+        'bookings': len(temporary_df),
+        'total_sales': float(sector_df['Amount'].sum()),
+        'total_profit': float(sector_df['Profit/Loss'].sum()),
+    }
+
+
+# One output folder per file set, named after the sales workbook and made unique if needed
+def _output_dirs(file_sets, output_root):
+    names = []
+    for _, sales_path, _ in file_sets:
+        name = os.path.splitext(os.path.basename(sales_path))[0]
+        candidate, suffix = name, 2
+        while candidate in names:
+            candidate, suffix = f'{name}_{suffix}', suffix + 1
+        names.append(candidate)
+    return [os.path.join(output_root, name) for name in names]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate inventory and P/L reports without Streamlit.")
+    parser.add_argument('--files', nargs=3, action='append', required=True,
+                        metavar=('INVENTORY', 'SALES', 'BASE_PRICE'),
+                        help="one inventory, sales and base price workbook; repeat for more file sets")
+    parser.add_argument('--start', type=pd.Timestamp, default=None, help="first travel date to include")
+    parser.add_argument('--end', type=pd.Timestamp, default=None, help="last travel date to include")
+    parser.add_argument('--output-dir', default='reports', help="folder the report folders are written to")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="number of file sets processed in parallel")
+    parser.add_argument('--sheet-workers', type=int, default=0,
+                        help="worker processes per file set for parsing and processing sheets (0 = serial)")
+    args = parser.parse_args(argv)
+    if args.start is not None and args.end is not None and args.start > args.end:
+        parser.error("--start must be before or equal to --end")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_dirs = _output_dirs(args.files, args.output_dir)
+    jobs = [(inventory_path, sales_path, base_price_path, output_dir, args.start, args.end, args.sheet_workers)
+            for (inventory_path, sales_path, base_price_path), output_dir in zip(args.files, output_dirs)]
+
+    workers = max(1, min(args.workers, len(jobs)))
+    failed = 0
+    if workers == 1:
+        results = []
+        for job in jobs:
+            try:
+                results.append(generate_reports(*job))
+            except Exception as e:
+                results.append(e)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(generate_reports, *job) for job in jobs]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(e)
+
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"FAILED {job[1]}: {result}", file=sys.stderr)
+        else:
+            print(f"{result['output_dir']}: {result['bookings']} bookings, "
+                  f"sales {result['total_sales']:,.2f}, profit {result['total_profit']:,.2f}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
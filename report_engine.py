@@ -0,0 +1,859 @@
+# Report engine: ingestion, preprocessing and the inventory and profit/loss
+# calculations behind the Analytics Accelerator pages. Nothing in here depends on
+# Streamlit, so the same code runs in the app and in the batch CLI (report_cli.py).
+import functools
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BufferedRandom, BytesIO
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# ---------------------------------------------------------------------------
+# Parallel per-sheet execution
+#
+# Sales and base price workbooks hold one sheet per period, and every stage
+# works sheet by sheet. With workers > 1 the sheets are parsed and processed in
+# worker processes; results are always combined in workbook sheet order, so the
+# output is identical to a serial run. Small inputs stay serial because starting
+# the workers would cost more than it saves.
+# ---------------------------------------------------------------------------
+
+# Worker processes for per-sheet work; 0 or 1 keeps everything in-process
+SHEET_WORKERS = int(os.environ.get('AA_SHEET_WORKERS', '0'))
+# Below these sizes the work runs serially even when workers are configured
+PARALLEL_MIN_ROWS = int(os.environ.get('AA_PARALLEL_MIN_ROWS', '200000'))
+PARALLEL_MIN_MB = int(os.environ.get('AA_PARALLEL_MIN_MB', '10'))
+
+def _sheet_executor(workers, initializer=None, initargs=()):
+    # Workers are spawned rather than forked: the Streamlit server is multi-threaded
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=initializer, initargs=initargs)
+
+def _parallel_workers(workers, tasks):
+    workers = SHEET_WORKERS if workers is None else workers
+    return max(0, min(workers, tasks))
+
+# Long-running readers and stages take an optional progress(step, done, total) callback,
+# called before the first sheet and after every sheet. The callback may raise to
+# cancel the work; sheets that have not started yet are then dropped.
+def progress_step(progress, step):
+    return None if progress is None else functools.partial(progress, step)
+
+def _collect(results, total, progress=None):
+    collected = []
+    if progress is not None:
+        progress(0, total)
+    for result in results:
+        collected.append(result)
+        if progress is not None:
+            progress(len(collected), total)
+    return collected
+
+def _collect_parallel(executor, func, total, progress, *iterables):
+    try:
+        return _collect(executor.map(func, *iterables), total, progress)
+    except BaseException:
+        executor.shutdown(cancel_futures=True)
+        raise
+
+# Apply func(one_sheet_dict, *args) to every sheet of df_dict and return the results
+# in sheet order. func must be a module-level function so workers can import it.
+def run_per_sheet(func, df_dict, *args, workers=None, min_rows=None, progress=None):
+    workers = _parallel_workers(workers, len(df_dict))
+    min_rows = PARALLEL_MIN_ROWS if min_rows is None else min_rows
+    single_sheets = [{sheet_name: df} for sheet_name, df in df_dict.items()]
+    if workers <= 1 or sum(len(df) for df in df_dict.values()) < min_rows:
+        return _collect((func(sheet, *args) for sheet in single_sheets), len(single_sheets), progress)
+    with _sheet_executor(workers) as executor:
+        return _collect_parallel(executor, func, len(single_sheets), progress, single_sheets,
+                                 *[[arg] * len(single_sheets) for arg in args])
+
+# ---------------------------------------------------------------------------
+# Report schemas
+#
+# Each uploaded report declares the columns it needs and how they are typed.
+# Ingestion reads only those columns, types them as it goes and fails early
+# with a SchemaError naming the missing columns when an export changes shape.
+# Column types: 'datetime', 'number', 'float', 'text' and 'category'.
+# ---------------------------------------------------------------------------
+
+SALES_SCHEMA = {
+    'report': 'Sales report',
+    'required': {'TravelDate': 'datetime', 'Sector': 'category', 'FlightNumber': None, 'Amount': 'float'},
+    # Only used to drop infant and child bookings
+    'optional': {'Type': 'text'},
+}
+
+INVENTORY_SCHEMA = {
+    'report': 'Inventory report',
+    'required': {'Flight Number': 'category', 'Sector': 'category', 'Dep Date': 'datetime',
+                 'Total Seat': 'number', 'Current Seat': 'number'},
+    'optional': {},
+}
+
+BASE_PRICE_SCHEMA = {
+    'report': 'Base Price file',
+    'required': {'Sector': 'text', 'Base': 'float'},
+    'optional': {},
+}
+
+class SchemaError(ValueError):
+    pass
+
+def schema_columns(schema):
+    return list(schema['required']) + list(schema['optional'])
+
+def _coerce_column(series, column_type):
+    if column_type == 'datetime':
+        return pd.to_datetime(series, errors='coerce')
+    if column_type == 'number':
+        return pd.to_numeric(series, errors='coerce')
+    if column_type == 'float':
+        return pd.to_numeric(series, errors='coerce').astype('float64')
+    if column_type == 'text':
+        return series.where(series.isna(), series.astype(str))
+    if column_type == 'category':
+        return series.where(series.isna(), series.astype(str)).astype('category')
+    return series
+
+# Check a sheet against its schema, keep only the schema's columns and type them
+def apply_schema(df, schema, sheet_name=None):
+    missing = [col for col in schema['required'] if col not in df.columns]
+    if missing:
+        where = f" (sheet '{sheet_name}')" if sheet_name is not None else ''
+        raise SchemaError(f"{schema['report']}{where} is missing required columns: {', '.join(missing)}")
+    column_types = {**schema['required'], **schema['optional']}
+    columns = [col for col in schema_columns(schema) if col in df.columns]
+    return pd.DataFrame({col: _coerce_column(df[col], column_types[col]) for col in columns})
+
+# Apply a schema to every sheet of a workbook. Sheets sharing none of the required
+# columns (notes, summaries) are skipped; sheets with only some of them are an error.
+def apply_schema_to_sheets(df_dict, schema):
+    typed = {}
+    for sheet_name, df in df_dict.items():
+        if not any(col in df.columns for col in schema['required']):
+            continue
+        typed[sheet_name] = apply_schema(df, schema, sheet_name)
+    return typed
+
+# ---------------------------------------------------------------------------
+# Key encoding
+#
+# Sector and flight keys are normalized once per distinct value instead of once
+# per row, and held as categoricals: small integer codes into a sorted dictionary
+# of the normalized keys. Sheets that are combined share one dictionary, so
+# concatenating them keeps the codes, and joins and groupbys compare integers
+# instead of hashing strings.
+# ---------------------------------------------------------------------------
+
+def normalize_sector(sector):
+    return str(sector).replace('-', '').replace(' ', '')
+
+# The inventory exports flights as "QP-1332" and the sales report as 1332; both become 1332
+def normalize_flight(flight):
+    if isinstance(flight, str):
+        flight = flight.strip().replace('QP-', '')
+        return int(flight) if flight.isdigit() else flight
+    if isinstance(flight, float) and flight.is_integer():
+        return int(flight)
+    return flight
+
+def _sorted_keys(keys):
+    keys = pd.Index(keys).unique()
+    try:
+        return keys.sort_values()
+    except TypeError:
+        # Mixed numeric and text keys are ordered by their text
+        return keys[np.argsort(keys.astype(str), kind='stable')]
+
+# Normalize the distinct values of a key column and encode it against the sorted normalized keys
+def encode_keys(series, normalize):
+    codes, uniques = pd.factorize(series)
+    normalized = [normalize(value) for value in uniques]
+    categories = _sorted_keys(normalized)
+    # The trailing -1 maps missing values (code -1) to missing
+    lookup = np.append(categories.get_indexer(normalized), -1)
+    encoded = pd.Categorical.from_codes(lookup[codes], dtype=pd.CategoricalDtype(categories))
+    return pd.Series(encoded, index=series.index, name=series.name)
+
+# Re-code the key columns of every sheet against one dictionary per column
+def share_key_dictionaries(df_dict, columns):
+    shared = dict(df_dict)
+    for column in columns:
+        frames = [df for df in shared.values() if column in df.columns]
+        categories = _sorted_keys([key for df in frames for key in df[column].cat.categories])
+        shared = {sheet_name: df.assign(**{column: df[column].cat.set_categories(categories)})
+                  if column in df.columns else df for sheet_name, df in shared.items()}
+    return shared
+
+def filter_infant_child(df_dict):
+    filtered = {}
+    for sheet_name, df in df_dict.items():
+        if 'Type' in df.columns:
+            df = df[~df['Type'].isin(['infant', 'child'])].drop(columns='Type')
+        filtered[sheet_name] = df
+    return filtered
+
+def sort_by_travel_date(df_dict):
+    sorted_dict = {}
+    for sheet_name, df in df_dict.items():
+        if 'TravelDate' in df.columns:
+            df = df.sort_values(by='TravelDate')
+        sorted_dict[sheet_name] = df
+    return sorted_dict
+
+# Key columns of the sales report and how their values are normalized
+SALES_KEYS = {'Sector': normalize_sector, 'FlightNumber': normalize_flight}
+
+def encode_sales_keys(df_dict):
+    encoded = {}
+    for sheet_name, df in df_dict.items():
+        keys = {col: encode_keys(df[col], normalize) for col, normalize in SALES_KEYS.items() if col in df.columns}
+        encoded[sheet_name] = df.assign(**keys)
+    return encoded
+
+# Save the modified sales report to a new Excel file in-memory, only used for downloads
+def save_modified_sales(df_dict):
+    modified_sales = BytesIO()
+    write_xlsx([(sheet_name, df) for sheet_name, df in df_dict.items() if not df.empty], modified_sales)
+    modified_sales.seek(0)  # Reset the buffer to the beginning
+    return modified_sales
+
+# ---------------------------------------------------------------------------
+# xlsx reader backend
+#
+# AA_EXCEL_ENGINE picks the pandas engine used to parse workbooks: 'calamine'
+# (the Rust-based python-calamine reader, several times faster), 'openpyxl',
+# or 'auto' (default), which uses calamine when it is installed and openpyxl
+# otherwise. Both engines return the same frames for these reports.
+# ---------------------------------------------------------------------------
+
+EXCEL_ENGINE = os.environ.get('AA_EXCEL_ENGINE', 'auto')
+
+def resolve_excel_engine(engine=None):
+    engine = EXCEL_ENGINE if engine is None else engine
+    if engine == 'auto':
+        return 'calamine' if importlib.util.find_spec('python_calamine') is not None else 'openpyxl'
+    if engine not in ('calamine', 'openpyxl'):
+        raise ValueError(f"Unknown Excel engine {engine!r}; expected 'auto', 'calamine' or 'openpyxl'")
+    return engine
+
+def open_workbook(data, engine=None):
+    return pd.ExcelFile(BytesIO(data), engine=resolve_excel_engine(engine))
+
+# ---------------------------------------------------------------------------
+# On-disk columnar cache of parsed workbooks
+#
+# Parsing xlsx XML is the slowest part of every page load, so each sheet is
+# parsed once and written as an uncompressed Feather (Arrow IPC) file under
+# DISK_CACHE_DIR/<file hash>/. Later sessions memory-map those files instead.
+# Whole workbooks are evicted least recently used first once the directory
+# grows past DISK_CACHE_MAX_MB; setting it to 0 disables the disk cache.
+# ---------------------------------------------------------------------------
+
+DISK_CACHE_DIR = os.environ.get('AA_DISK_CACHE_DIR',
+                                os.path.join(tempfile.gettempdir(), 'analytics_accelerator_cache'))
+DISK_CACHE_MAX_MB = int(os.environ.get('AA_DISK_CACHE_MB', '2048'))
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+# Remove the least recently used workbooks until the cache fits in DISK_CACHE_MAX_MB
+def evict_disk_cache(keep=None):
+    try:
+        workbook_dirs = [os.path.join(DISK_CACHE_DIR, name) for name in os.listdir(DISK_CACHE_DIR)]
+    except FileNotFoundError:
+        return
+    workbook_dirs = [path for path in workbook_dirs if os.path.isdir(path)]
+    sizes = {path: _directory_size(path) for path in workbook_dirs}
+    total = sum(sizes.values())
+    max_bytes = DISK_CACHE_MAX_MB * 1024 * 1024
+    for path in sorted(workbook_dirs, key=os.path.getmtime):
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.basename(path) == keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= sizes[path]
+
+# Excel columns often mix numbers and text (e.g. a numeric 'Series Owner' code among
+# strings), which Arrow cannot store. Such columns are read as text, whether or not
+# the sheet came from the cache, so a cache hit returns exactly what a fresh parse does.
+def _normalize_mixed_columns(df):
+    mixed = {}
+    for col in df.columns[df.dtypes == object]:
+        values = df[col].dropna()
+        is_text = values.map(lambda value: isinstance(value, str))
+        if is_text.any() and not is_text.all():
+            mixed[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df.assign(**mixed) if mixed else df
+
+def _write_feather(df, path):
+    # Feather needs string column names and a default index; anything else stays uncached
+    if not all(isinstance(col, str) for col in df.columns):
+        return False
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        feather.write_feather(df.reset_index(drop=True), tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+        return True
+    except (pa.ArrowException, ValueError, TypeError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+def _read_feather(path):
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+# Only parse the given columns; columns a sheet lacks are simply absent from the result
+def _usecols(columns):
+    if columns is None:
+        return None
+    wanted = set(columns)
+    return lambda col: col in wanted
+
+def _parse_sheet(data, sheet_name, columns, excel_file=None):
+    excel_file = excel_file if excel_file is not None else open_workbook(data)
+    return _normalize_mixed_columns(excel_file.parse(sheet_name, usecols=_usecols(columns)))
+
+# Workbook opened once by each parsing worker, so tasks only carry a sheet name
+_worker_workbook = None
+
+def _open_worker_workbook(data):
+    global _worker_workbook
+    _worker_workbook = open_workbook(data)
+
+def _parse_worker_sheet(sheet_name, columns):
+    return _parse_sheet(None, sheet_name, columns, _worker_workbook)
+
+# Parse several sheets of one workbook, in worker processes when the workbook is big enough.
+# The workbook bytes go to each worker once, not with every sheet.
+def _parse_sheets(data, sheet_names, columns, workers=None, excel_file=None, progress=None):
+    if not sheet_names:
+        return []
+    workers = _parallel_workers(workers, len(sheet_names))
+    count = len(sheet_names)
+    if workers <= 1 or len(data) < PARALLEL_MIN_MB * 1024 * 1024:
+        excel_file = excel_file if excel_file is not None else open_workbook(data)
+        return _collect((_parse_sheet(data, name, columns, excel_file) for name in sheet_names), count, progress)
+    with _sheet_executor(workers, _open_worker_workbook, (data,)) as executor:
+        return _collect_parallel(executor, _parse_worker_sheet, count, progress, sheet_names, [columns] * count)
+
+# Read one sheet (by name or position) or, with sheet_name=None, every sheet of a
+# workbook, going through the on-disk cache keyed by the workbook's content hash.
+# With columns, only those columns are parsed and cached.
+def read_workbook_cached(data, digest, sheet_name=None, columns=None, workers=None, progress=None):
+    if DISK_CACHE_MAX_MB <= 0:
+        if sheet_name is not None:
+            return _parse_sheets(data, [sheet_name], columns, progress=progress)[0]
+        sheet_names = open_workbook(data).sheet_names
+        return dict(zip(sheet_names, _parse_sheets(data, sheet_names, columns, workers, progress=progress)))
+
+    workbook_dir = os.path.join(DISK_CACHE_DIR, digest)
+    manifest_path = os.path.join(workbook_dir, 'manifest.json')
+    excel_file = None
+    try:
+        with open(manifest_path) as manifest_file:
+            sheet_names = json.load(manifest_file)['sheets']
+    except (OSError, ValueError, KeyError):
+        excel_file = open_workbook(data)
+        sheet_names = excel_file.sheet_names
+        os.makedirs(workbook_dir, exist_ok=True)
+        manifest_tmp = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(manifest_tmp, 'w') as manifest_file:
+            json.dump({'sheets': sheet_names}, manifest_file)
+        os.replace(manifest_tmp, manifest_path)
+
+    if sheet_name is None:
+        wanted = list(range(len(sheet_names)))
+    elif isinstance(sheet_name, int):
+        wanted = [sheet_name]
+    else:
+        wanted = [sheet_names.index(sheet_name)]
+
+    # Projections of the same sheet are cached side by side
+    projection = 'all' if columns is None else hashlib.sha1(
+        json.dumps(sorted(columns)).encode()).hexdigest()[:12]
+    sheet_paths = {position: os.path.join(workbook_dir, f'sheet_{position}.{projection}.feather')
+                   for position in wanted}
+    sheets = {}
+    missing = []
+    for position in wanted:
+        if os.path.exists(sheet_paths[position]):
+            try:
+                sheets[position] = _read_feather(sheet_paths[position])
+                continue
+            except (pa.ArrowException, OSError):
+                pass
+        missing.append(position)
+
+    wrote = False
+    parsed = _parse_sheets(data, [sheet_names[position] for position in missing], columns, workers, excel_file,
+                           progress)
+    for position, df in zip(missing, parsed):
+        wrote = _write_feather(df, sheet_paths[position]) or wrote
+        sheets[position] = df
+    sheets = {sheet_names[position]: sheets[position] for position in wanted}
+
+    # Touch the workbook directory so eviction sees it as recently used
+    os.utime(workbook_dir)
+    if wrote:
+        evict_disk_cache(keep=digest)
+    if sheet_name is None:
+        return sheets
+    return sheets[sheet_names[wanted[0]]]
+
+# ---------------------------------------------------------------------------
+# Streaming ingestion for very large sales workbooks
+#
+# pd.read_excel materializes every sheet with every column before the
+# infant/child filter and the column drop run. Sales files of at least
+# STREAMING_SALES_MIN_MB are instead read row by row with openpyxl's read-only
+# mode, filtering and projecting as they go, so peak memory follows the rows
+# and columns that are kept rather than the raw workbook.
+# ---------------------------------------------------------------------------
+
+STREAMING_SALES_MIN_MB = int(os.environ.get('AA_STREAMING_SALES_MB', '50'))
+STREAMING_BATCH_ROWS = int(os.environ.get('AA_STREAMING_BATCH_ROWS', '50000'))
+
+# Yield (sheet name, DataFrame) batches of sales rows without infants/children, keeping only the schema's columns
+def iter_sales_batches(data, batch_rows=STREAMING_BATCH_ROWS):
+    workbook = openpyxl.load_workbook(BytesIO(data), read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            header = [f'Unnamed: {i}' if col is None else col for i, col in enumerate(header)]
+            keep = [i for i, col in enumerate(header) if col in schema_columns(SALES_SCHEMA)]
+            columns = [header[i] for i in keep]
+            type_index = header.index('Type') if 'Type' in header else None
+
+            batch = []
+            yielded = False
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                if type_index is not None and type_index < len(row) and row[type_index] in ('infant', 'child'):
+                    continue
+                batch.append([row[i] if i < len(row) else None for i in keep])
+                if len(batch) >= batch_rows:
+                    yield worksheet.title, pd.DataFrame(batch, columns=columns)
+                    batch = []
+                    yielded = True
+            # Sheets with a header and no rows still come back, as they do from pd.read_excel
+            if batch or not yielded:
+                yield worksheet.title, pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+# Streamed reads report the rows kept so far; the total is not known up front
+def read_sales_streaming(data, batch_rows=STREAMING_BATCH_ROWS, progress=None):
+    batches = {}
+    rows = 0
+    for sheet_name, batch in iter_sales_batches(data, batch_rows):
+        batches.setdefault(sheet_name, []).append(batch)
+        rows += len(batch)
+        if progress is not None:
+            progress(rows, None)
+    return {sheet_name: pd.concat(frames, ignore_index=True) for sheet_name, frames in batches.items()}
+
+# ---------------------------------------------------------------------------
+# Report readers
+#
+# Each reader takes the raw bytes of an uploaded workbook and returns it fully
+# preprocessed. The optional digest keys the on-disk cache; it is the SHA-256
+# of the bytes and is computed here when the caller doesn't already have it.
+# ---------------------------------------------------------------------------
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+# Clean sales sheets of infants/children and irrelevant columns, sort them and encode their keys
+def clean_sales_sheets(df_dict):
+    df_dict = {sheet_name: df for sheet_name, df in df_dict.items() if not df.empty}
+    df_dict = apply_schema_to_sheets(df_dict, SALES_SCHEMA)
+    df_dict = filter_infant_child(df_dict)
+    df_dict = sort_by_travel_date(df_dict)
+    return encode_sales_keys(df_dict)
+
+def read_sales_report(data, digest=None, workers=None, progress=None):
+    if len(data) >= STREAMING_SALES_MIN_MB * 1024 * 1024:
+        df_dict = read_sales_streaming(data, progress=progress_step(progress, 'Reading rows'))
+    else:
+        df_dict = read_workbook_cached(data, digest or content_digest(data), columns=schema_columns(SALES_SCHEMA),
+                                       workers=workers, progress=progress_step(progress, 'Reading sheets'))
+    cleaned = {}
+    for sheet_dict in run_per_sheet(clean_sales_sheets, df_dict, workers=workers,
+                                    progress=progress_step(progress, 'Cleaning sheets')):
+        cleaned.update(sheet_dict)
+    return share_key_dictionaries(cleaned, list(SALES_KEYS))
+
+def read_base_price_index(data, digest=None, workers=None, progress=None):
+    base_price_dict = read_workbook_cached(data, digest or content_digest(data),
+                                           columns=schema_columns(BASE_PRICE_SCHEMA), workers=workers,
+                                           progress=progress_step(progress, 'Reading sheets'))
+    return build_base_price_index(apply_schema_to_sheets(base_price_dict, BASE_PRICE_SCHEMA))
+
+def read_inventory_report(data, digest=None, progress=None):
+    df2 = read_workbook_cached(data, digest or content_digest(data), sheet_name=0,
+                               columns=schema_columns(INVENTORY_SCHEMA),
+                               progress=progress_step(progress, 'Reading sheets'))
+    return process_inventory_report(df2)
+
+# ---------------------------------------------------------------------------
+# Inventory report
+# ---------------------------------------------------------------------------
+
+def process_inventory_report(df2):
+    df2 = apply_schema(df2, INVENTORY_SCHEMA)
+    df2['Flight Number'] = encode_keys(df2['Flight Number'], normalize_flight)
+    df2['Sector'] = encode_keys(df2['Sector'], normalize_sector)
+    df2.rename(columns={'Current Seat': 'Unsold Seats', 'Total Seat': 'Total Seats'}, inplace=True)
+
+    #removing the rows where total seats is 0 to avoid division by zero error
+    df2 = df2[df2['Total Seats'] != 0].copy()
+
+    # Adding new columns
+    df2['Sold Seats'] = df2['Total Seats'] - df2['Unsold Seats']
+    df2['MAT_Ratio'] = df2['Sold Seats'] / df2['Total Seats'] * 100
+    df2['Release Ratio'] = df2['Unsold Seats'] / df2['Total Seats'] * 100
+    return df2
+
+# Seat totals and mean ratios per sector, as shown in "Inventory Report by Sector"
+def inventory_by_sector(df2):
+    return df2.groupby('Sector', observed=True).agg({
+        'Total Seats': 'sum',
+        'Sold Seats': 'sum',
+        'Unsold Seats': 'sum',
+        'MAT_Ratio': 'mean',
+        'Release Ratio': 'mean'
+    }).reset_index()
+
+# Mean MAT Ratio and Release Ratio per sector, behind the inventory gauges
+def ratios_by_sector(df2):
+    return df2.groupby('Sector', observed=True).agg({'MAT_Ratio': 'mean', 'Release Ratio': 'mean'}).reset_index()
+
+# ---------------------------------------------------------------------------
+# Profit and loss
+# ---------------------------------------------------------------------------
+
+# Columns of the row-level profit/loss frame shared by the P/L pages
+PL_COLUMNS = ['Sector', 'Date', 'FlightNumber', 'Amount', 'Base', 'Profit/Loss']
+
+# Split the overlapping validity windows of one sector (sorted by valid_from, then by
+# sheet_order descending) into non-overlapping segments, each priced by the latest-starting
+# window covering it; of windows starting the same day, the earlier sheet in the workbook
+# wins. Days no window covers are left out.
+def _flatten_windows(sector_df):
+    starts = sector_df['valid_from'].to_numpy()
+    ends = sector_df['valid_to'].to_numpy()
+    day = np.timedelta64(1, 'D')
+    bounds = np.unique(np.concatenate([starts, ends + day]))
+    segment_from, segment_to = bounds[:-1], bounds[1:] - day
+    covers = (starts[None, :] <= segment_from[:, None]) & (ends[None, :] >= segment_from[:, None])
+    covered = covers.any(axis=1)
+    latest = covers.shape[1] - 1 - np.argmax(covers[:, ::-1], axis=1)
+    return pd.DataFrame({
+        'Sector': sector_df['Sector'].iloc[0],
+        'Base': sector_df['Base'].to_numpy()[latest[covered]],
+        'valid_from': segment_from[covered],
+        'valid_to': segment_to[covered],
+    })
+
+# Parse the base price workbook once into a (Sector, valid_from, valid_to, Base) index.
+# Sheets are named "<start>_<end>"; sheets whose name is not a date range are skipped.
+# Overlapping sheets (e.g. a promo inside an annual sheet) are flattened so every day
+# maps to the latest-starting sheet covering it (the earlier sheet in the workbook when two
+# start the same day), and the annual price resumes after the promo. Rows are sorted by validity start so lookups can binary-search on the travel date.
+def build_base_price_index(base_price_dict):
+    frames = []
+    for sheet_order, (sheet_name, base_df) in enumerate(base_price_dict.items()):
+        date_range = str(sheet_name).split('_')
+        if len(date_range) != 2 or not {'Sector', 'Base'}.issubset(base_df.columns):
+            continue
+        try:
+            valid_from = pd.to_datetime(date_range[0])
+            valid_to = pd.to_datetime(date_range[1])
+        except (ValueError, TypeError):
+            continue
+        # Only the first row of a sector counts within a sheet
+        sheet_df = base_df[['Sector', 'Base']].dropna(subset=['Sector'])
+        sheet_df = sheet_df.drop_duplicates(subset='Sector', keep='first')
+        frames.append(sheet_df.assign(valid_from=valid_from, valid_to=valid_to, sheet_order=sheet_order))
+    if not frames:
+        return pd.DataFrame({
+            'Sector': pd.Series(dtype=object),
+            'Base': pd.Series(dtype=float),
+            'valid_from': pd.Series(dtype='datetime64[ns]'),
+            'valid_to': pd.Series(dtype='datetime64[ns]'),
+        })
+    base_index = pd.concat(frames, ignore_index=True)
+    # Later sheets first among those starting on the same day, so flattening prefers the earlier one
+    base_index = base_index.sort_values(['valid_from', 'sheet_order'], ascending=[True, False], kind='stable')
+
+    # Only sectors whose windows overlap need flattening
+    previous_end = base_index.groupby('Sector', sort=False)['valid_to'].cummax().groupby(
+        base_index['Sector'], sort=False).shift()
+    overlapping = base_index['Sector'].isin(base_index.loc[previous_end >= base_index['valid_from'], 'Sector'])
+    if overlapping.any():
+        flattened = [_flatten_windows(sector_df)
+                     for _, sector_df in base_index[overlapping].groupby('Sector', sort=False)]
+        base_index = pd.concat([base_index[~overlapping]] + flattened, ignore_index=True)
+        base_index = base_index.sort_values('valid_from', kind='stable')
+    return base_index.drop(columns='sheet_order').reset_index(drop=True)
+
+# Look up the base price valid on each booking's own travel date for its sector.
+# The index has no overlapping windows, so merge_asof's latest window starting on or
+# before the date is the only candidate; rows past its end date (or with no window
+# at all) get NaN.
+def lookup_base_prices(base_index, sectors, dates):
+    sectors = pd.Series(sectors)
+    if isinstance(sectors.dtype, pd.CategoricalDtype):
+        sector_codes, categories = sectors.cat.codes.to_numpy(), sectors.cat.categories
+    else:
+        sector_codes, categories = pd.factorize(sectors)
+    # Both sides are joined on the bookings' sector codes; base rows for sectors never booked drop out
+    base_codes = pd.Index(categories).get_indexer(base_index['Sector'])
+    base_index = base_index.drop(columns='Sector').assign(sector_code=base_codes)[base_codes >= 0]
+    bookings = pd.DataFrame({'sector_code': sector_codes.astype(base_codes.dtype),
+                             'Date': pd.Series(dates).to_numpy(), 'row': range(len(dates))})
+    if bookings.empty or base_index.empty:
+        return pd.Series(float('nan'), index=bookings['row'], name='Base')
+    bookings = bookings.sort_values('Date', kind='stable')
+    matched = pd.merge_asof(bookings, base_index, left_on='Date', right_on='valid_from',
+                            by='sector_code', direction='backward')
+    expired = matched['Date'].dt.normalize() > matched['valid_to']
+    base = matched['Base'].where(~expired)
+    base.index = matched['row']
+    return base.sort_index().rename('Base')
+
+# Price the bookings of some sales sheets; None when none of them has travel dates
+def price_sales_sheets(new_df1, base_index):
+    sales_frames = []
+    for sheet_name, df in new_df1.items():
+        if 'TravelDate' in df.columns:
+            sales_frames.append(df.loc[df['TravelDate'].notna(), ['Sector', 'TravelDate', 'FlightNumber', 'Amount']])
+    if not sales_frames:
+        return None
+    temporary_df = pd.concat(sales_frames, ignore_index=True).rename(columns={'TravelDate': 'Date'})
+    temporary_df['Base'] = lookup_base_prices(base_index, temporary_df['Sector'], temporary_df['Date']).values
+    temporary_df['Profit/Loss'] = temporary_df['Amount'] - temporary_df['Base']
+    return temporary_df[PL_COLUMNS]
+
+# Join every sales row to the base price valid on its travel date. The result is
+# computed once per dataset and sorted by Date, so a date range is just a slice of it.
+def calculate_profit_loss(new_df1, base_index, workers=None, progress=None):
+    priced = [df for df in run_per_sheet(price_sales_sheets, new_df1, base_index, workers=workers,
+                                         progress=progress_step(progress, 'Pricing sheets'))
+              if df is not None]
+    if not priced:
+        empty_df = pd.DataFrame(columns=PL_COLUMNS)
+        return empty_df.astype({'Date': 'datetime64[ns]', 'Amount': float, 'Base': float, 'Profit/Loss': float})
+    temporary_df = pd.concat(priced, ignore_index=True)
+    return temporary_df.sort_values('Date', kind='stable', ignore_index=True)
+
+# Rows of a Date-sorted frame between start_date and end_date inclusive, found by binary search
+def slice_by_date(df, start_date, end_date, column='Date'):
+    dates = df[column].to_numpy()
+    lower = dates.searchsorted(pd.Timestamp(start_date).to_datetime64(), side='left')
+    upper = dates.searchsorted(pd.Timestamp(end_date).to_datetime64(), side='right')
+    return df.iloc[lower:upper]
+
+# Pre-aggregate the bookings into a (day, sector, flight) cube of summed Amount, Base
+# and Profit/Loss plus the number of bookings, sorted by Date so it can be sliced too.
+def build_daily_cube(temporary_df):
+    keys = [temporary_df['Date'].dt.normalize(), temporary_df['Sector'], temporary_df['FlightNumber']]
+    cube = temporary_df.groupby(keys, observed=True, dropna=False, sort=True).agg(
+        **{'Amount': ('Amount', 'sum'), 'Base': ('Base', 'sum'), 'Profit/Loss': ('Profit/Loss', 'sum'),
+           'Bookings': ('Amount', 'size')})
+    return cube.reset_index()
+
+# Sector totals of a cube slice, as shown in the sector tables and charts
+def sector_totals(cube):
+    return cube.groupby('Sector', observed=True).agg({'Profit/Loss': 'sum', 'Base': 'sum', 'Amount': 'sum'}).reset_index()
+
+# Sector totals of the priced bookings only, as shown in the P/L report
+def profit_loss_by_sector(temporary_df):
+    return sector_totals(temporary_df.dropna(subset=['Profit/Loss']))
+
+# ---------------------------------------------------------------------------
+# Combined inventory and profit/loss
+#
+# The inventory's seats and the bookings' revenue meet per flight and day, on
+# (Date, Sector, FlightNumber), so revenue can be read against seats: revenue
+# per sold seat, margin against load factor and the revenue exposed in unsold
+# seats. Both sides are first aggregated to one row per key and re-coded against
+# shared key dictionaries, so the join is a single index join on integer codes.
+# ---------------------------------------------------------------------------
+
+COMBINED_KEYS = ['Date', 'Sector', 'FlightNumber']
+COMBINED_SUM_COLUMNS = ['Total Seats', 'Sold Seats', 'Unsold Seats', 'Sold Seats with Sales', 'Bookings', 'Amount',
+                        'Priced Amount', 'Profit/Loss', 'Unsold Exposure']
+
+# Seats per (day, sector, flight) of the processed inventory
+def inventory_by_flight(df2):
+    keys = [df2['Dep Date'].dt.normalize().rename('Date'), df2['Sector'], df2['Flight Number'].rename('FlightNumber')]
+    seats = df2.groupby(keys, observed=True, sort=False)[['Total Seats', 'Sold Seats', 'Unsold Seats']].sum()
+    return seats.reset_index()
+
+# Revenue and profit/loss per (day, sector, flight). Priced Amount only counts bookings with
+# a base price, so margins are not diluted by bookings that could not be priced.
+def profit_loss_by_flight(temporary_df):
+    priced_amount = temporary_df['Amount'].where(temporary_df['Profit/Loss'].notna())
+    keys = [temporary_df['Date'].dt.normalize(), temporary_df['Sector'], temporary_df['FlightNumber']]
+    sales = temporary_df.assign(**{'Priced Amount': priced_amount}).groupby(keys, observed=True, sort=False).agg(
+        **{'Bookings': ('Amount', 'size'), 'Amount': ('Amount', 'sum'), 'Priced Amount': ('Priced Amount', 'sum'),
+           'Profit/Loss': ('Profit/Loss', 'sum')})
+    return sales.reset_index()
+
+# Load factor, revenue per sold seat and margin from summed seat and revenue columns
+def _seat_metrics(df):
+    df['Load Factor'] = df['Sold Seats'] / df['Total Seats'].where(df['Total Seats'] != 0) * 100
+    df['Revenue per Sold Seat'] = df['Amount'] / df['Sold Seats with Sales'].where(df['Sold Seats with Sales'] > 0)
+    df['Margin %'] = df['Profit/Loss'] / df['Priced Amount'].where(df['Priced Amount'] > 0) * 100
+    return df
+
+def _key_index(df):
+    return pd.MultiIndex.from_arrays([df['Date'].to_numpy(), df['Sector'].cat.codes.to_numpy(),
+                                      df['FlightNumber'].cat.codes.to_numpy()])
+
+# Join every inventory flight-day to the bookings of that flight, sector and day.
+# Flights without bookings keep their seats with zero revenue. Unsold Exposure values
+# the unsold seats at the flight's revenue per sold seat, or at its sector's average
+# when the flight has no bookings. The result is sorted by Date so it can be sliced.
+def join_inventory_profit_loss(df2, temporary_df):
+    frames = {'seats': inventory_by_flight(df2), 'sales': profit_loss_by_flight(temporary_df)}
+    for name, df in frames.items():
+        keys = {col: encode_keys(df[col], normalize) for col, normalize in SALES_KEYS.items()
+                if not isinstance(df[col].dtype, pd.CategoricalDtype)}
+        frames[name] = df.assign(**keys)
+    frames = share_key_dictionaries(frames, list(SALES_KEYS))
+    seats, sales = frames['seats'], frames['sales']
+
+    sales_values = sales.drop(columns=COMBINED_KEYS).set_axis(_key_index(sales))
+    joined = seats.set_axis(_key_index(seats)).join(sales_values, how='left').reset_index(drop=True)
+    joined[['Bookings', 'Amount', 'Priced Amount', 'Profit/Loss']] = (
+        joined[['Bookings', 'Amount', 'Priced Amount', 'Profit/Loss']].fillna(0))
+    joined['Bookings'] = joined['Bookings'].astype('int64')
+    joined['Sold Seats with Sales'] = joined['Sold Seats'].where(joined['Bookings'] > 0, 0)
+    joined = _seat_metrics(joined)
+
+    sector_amount = joined.groupby('Sector', observed=True)['Amount'].transform('sum')
+    sector_sold = joined.groupby('Sector', observed=True)['Sold Seats with Sales'].transform('sum')
+    fare = joined['Revenue per Sold Seat'].fillna(sector_amount / sector_sold.where(sector_sold > 0))
+    joined['Unsold Exposure'] = joined['Unsold Seats'] * fare
+    return joined.sort_values('Date', kind='stable', ignore_index=True)
+
+# Sector totals of a joined slice with their load factor, revenue per sold seat and margin
+def combined_by_sector(joined):
+    sector_df = joined.groupby('Sector', observed=True)[COMBINED_SUM_COLUMNS].sum().reset_index()
+    return _seat_metrics(sector_df)
+
+# Flight-days grouped into load factor bands of band_width percent, with the margin of each band
+def margin_by_load_factor(joined, band_width=10):
+    edges = list(range(0, 100 + band_width, band_width))
+    labels = [f'{lower}-{upper}%' for lower, upper in zip(edges, edges[1:])]
+    bands = pd.cut(joined['Load Factor'], bins=edges, labels=labels, include_lowest=True).rename('Load Factor Band')
+    grouped = joined.groupby(bands, observed=False)
+    band_df = grouped[COMBINED_SUM_COLUMNS].sum()
+    band_df.insert(0, 'Flights', grouped.size())
+    return _seat_metrics(band_df.reset_index())
+
+# ---------------------------------------------------------------------------
+# Report exports
+#
+# Report tables are written out chunk by chunk: CSV in slices of rows, Parquet
+# as one row group per chunk and xlsx through openpyxl's write-only mode, so no
+# full text or cell-model copy of a table is built. The output goes to a temporary
+# file on disk that the caller reads or streams from and closes.
+# ---------------------------------------------------------------------------
+
+EXPORT_CHUNK_ROWS = int(os.environ.get('AA_EXPORT_CHUNK_ROWS', '100000'))
+# Excel allows 1,048,576 rows per sheet, including the header; longer tables continue on more sheets
+XLSX_MAX_ROWS = 1_048_576
+
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+def _chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def write_csv(df, buffer, chunk_rows=None):
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    df.iloc[:0].to_csv(buffer, mode='wb', index=False)
+    for chunk in _chunks(df, chunk_rows):
+        chunk.to_csv(buffer, mode='wb', index=False, header=False)
+
+def write_parquet(df, buffer, chunk_rows=None):
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    # The schema is taken from the whole table so every row group agrees on it
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(buffer, schema) as writer:
+        for chunk in _chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+# Cell values of a chunk with missing values as empty cells
+def _xlsx_rows(chunk):
+    return chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+
+# Write (sheet name, DataFrame) pairs to one workbook in write-only mode
+def write_xlsx(sheets, buffer, chunk_rows=None):
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_name, df in sheets:
+        for part, start in enumerate(range(0, max(len(df), 1), XLSX_MAX_ROWS - 1)):
+            worksheet = workbook.create_sheet(title=sheet_name if part == 0 else f'{sheet_name} ({part + 1})')
+            worksheet.append([str(col) for col in df.columns])
+            for chunk in _chunks(df.iloc[start:start + XLSX_MAX_ROWS - 1], chunk_rows):
+                for row in _xlsx_rows(chunk):
+                    worksheet.append(row)
+    if not workbook.worksheets:
+        workbook.create_sheet(title='Sheet1')
+    workbook.save(buffer)
+
+# Write one report table as a CSV, Parquet or xlsx file to a temporary file, returned
+# unbuffered and rewound (as accepted by st.download_button); closing it deletes it
+def export_report(df, export_format, sheet_name='Report'):
+    output = tempfile.TemporaryFile(buffering=0)
+    try:
+        buffer = BufferedRandom(output)
+        if export_format == 'CSV':
+            write_csv(df, buffer)
+        elif export_format == 'Parquet':
+            write_parquet(df, buffer)
+        elif export_format == 'Excel':
+            write_xlsx([(sheet_name, df)], buffer)
+        else:
+            raise ValueError(f"Unknown export format {export_format!r}; expected one of {', '.join(EXPORT_FORMATS)}")
+        buffer.flush()
+        buffer.detach()
+        output.seek(0)
+    except BaseException:
+        output.close()
+        raise
+    return output
@@ -0,0 +1,87 @@
+# Per-stage timing and memory instrumentation for the app's pipeline.
+#
+# Every measured stage records its wall time, rows in and out, how much the
+# process' peak RSS grew while it ran and, for cached stages, whether the cache
+# was hit. Records collect per script run (one Streamlit run per thread) for the
+# debug panel and, when AA_METRICS_LOG names a file, are appended to it as JSON
+# lines so production uploads can be profiled after the fact.
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_LOG = os.environ.get('AA_METRICS_LOG')
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+# Peak resident set size of this process so far, in megabytes
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+def row_count(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, dict):
+        counts = [row_count(item) for item in value.values()]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+# Start collecting the records of a new script run; context is stored with every record
+def start_run(**context):
+    _local.records = []
+    _local.stack = []
+    _local.context = context
+
+
+def run_records():
+    return list(getattr(_local, 'records', []))
+
+
+def _write_log(record):
+    if not METRICS_LOG:
+        return
+    with _log_lock:
+        with open(METRICS_LOG, 'a') as log_file:
+            log_file.write(json.dumps(record, default=str) + '\n')
+
+
+# Measure one stage. rows_in, rows_out and cache are set by the caller, as fields or on
+# the yielded record; stages nested inside this one are recorded separately.
+@contextmanager
+def measure(stage, **fields):
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        start_run()
+        stack = _local.stack
+    record = {'stage': stage, 'depth': len(stack), 'rows_in': None, 'rows_out': None, 'cache': None, **fields}
+    stack.append(record)
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = round(time.perf_counter() - started, 4)
+        rss_after = peak_rss_mb()
+        record['peak_rss_delta_mb'] = round(rss_after - rss_before, 1) if rss_before is not None else None
+        stack.pop()
+        record = {'time': datetime.now().isoformat(timespec='seconds'), **getattr(_local, 'context', {}), **record}
+        _local.records.append(record)
+        _write_log(record)
@@ -0,0 +1,44 @@
+# Regression checks for the base price index: every booking gets the price valid on its own date
+import math
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_engine import build_base_price_index, lookup_base_prices  # noqa: E402
+
+
+def prices(sheets, sectors, dates):
+    base_index = build_base_price_index({name: pd.DataFrame(rows) for name, rows in sheets.items()})
+    base = lookup_base_prices(base_index, sectors, pd.to_datetime(dates)).tolist()
+    return [None if math.isnan(value) else value for value in base]
+
+
+# A promo inside an annual sheet only applies while it runs; the annual price resumes after it
+def test_nested_promo_falls_back_to_enclosing_sheet():
+    sheets = {
+        '2024-01-01_2024-12-31': {'Sector': ['A'], 'Base': [100.0]},
+        '2024-06-01_2024-06-05': {'Sector': ['A'], 'Base': [50.0]},
+    }
+    dates = ['2024-05-31', '2024-06-01', '2024-06-05', '2024-06-06', '2024-12-31', '2025-01-01']
+    assert prices(sheets, ['A'] * 6, dates) == [100.0, 50.0, 50.0, 100.0, 100.0, None]
+
+
+# Two sheets starting the same day: the earlier sheet wins only while both cover the date
+def test_same_start_keeps_the_longer_sheet_after_the_shorter_ends():
+    sheets = {
+        '2024-01-01_2024-01-05': {'Sector': ['A'], 'Base': [100.0]},
+        '2024-01-01_2024-12-31': {'Sector': ['A'], 'Base': [200.0]},
+    }
+    dates = ['2024-01-01', '2024-01-05', '2024-01-06', '2024-03-01', '2025-01-01']
+    assert prices(sheets, ['A'] * 5, dates) == [100.0, 100.0, 200.0, 200.0, None]
+
+
+def test_same_start_and_end_prefers_the_earlier_sheet():
+    sheets = {
+        '2024-01-01_2024-12-31': {'Sector': ['A'], 'Base': [100.0]},
+        '2024-1-1_2024-12-31': {'Sector': ['A'], 'Base': [200.0]},
+    }
+    assert prices(sheets, ['A'], ['2024-03-01']) == [100.0]